@@ -0,0 +1,84 @@
+#==============================================================================
+# Requirements
+#==============================================================================
+
+# Standard libs ---------------------------------------------------------------
+
+import importlib.util
+import os
+import timeit
+
+#==============================================================================
+# Miror codec micro-benchmark
+#==============================================================================
+
+# Load the codec alone, so that the benchmark doesn't need discord or allay
+spec = importlib.util.spec_from_file_location(
+    "codec",
+    os.path.join(os.path.dirname(__file__), "..", "src", "codec.py")
+)
+codec = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(codec)
+WhMirorCodec = codec.WhMirorCodec
+
+JUMP_URL = "https://discord.com/channels/{}/{}/{}"
+
+def sample(size:int, reference:bool) -> str:
+    content = ("Lorem ipsum dolor sit amet, [link](<https://example.com>)\n"
+        * (size // 57 + 1))[:size]
+
+    miror = WhMirorCodec.encode_content(
+        content,
+        JUMP_URL.format(1, 2, 3)
+    )
+    if reference:
+        miror = WhMirorCodec.encode_reference(
+            "Someone",
+            JUMP_URL.format(1, 2, 4),
+            content
+        ) + miror
+    return miror
+
+# Truncation prefix looked for by the previous extraction (it never matched
+# the suffix actually written, so truncated mirors kept their suffix)
+LEGACY_TRUNC_PREFIX = "[...](<https://discord.com/channels/"
+
+def legacy_extract(content:str) -> str:
+    # Previous split-based extraction, for comparison
+    if content.startswith(WhMirorCodec.reference_prefix):
+        content = "\n".join(content.split("\n")[1:])
+    if content.endswith(">)"):
+        parts = content.split(LEGACY_TRUNC_PREFIX)
+        if len(parts) > 1:
+            content = LEGACY_TRUNC_PREFIX.join(parts[:-1])
+    return content
+
+def main(number:int=10000) -> None:
+    for size, reference in (
+            (100, False),
+            (100, True),
+            (2000, False),
+            (2000, True),
+            (2500, False),
+            (2500, True)
+        ):
+        miror = sample(size, reference)
+        content = WhMirorCodec.decode(miror).content
+        assert WhMirorCodec.decode_content(miror) == content
+        if size <= WhMirorCodec.max_length:
+            assert legacy_extract(miror) == content
+
+        for name, function in (
+                ("legacy", legacy_extract),
+                ("content", WhMirorCodec.decode_content),
+                ("decode", WhMirorCodec.decode)
+            ):
+            duration = timeit.timeit(lambda: function(miror), number=number)
+            print(
+                f"{name:>7} | {size:>4} chars | "\
+                + f"reference: {str(reference):<5} | "\
+                + f"{duration / number * 1e6:8.2f} µs"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,7 @@ CREATE TABLE IF NOT EXISTS `wormhole_admins` (
   `user_id` BIGINT NOT NULL
 );
 CREATE INDEX IF NOT EXISTS idx_wormhole_admins ON `wormhole_admins` (`wormhole_id`);
+CREATE INDEX IF NOT EXISTS idx_wormhole_admins_user ON `wormhole_admins` (`user_id`, `wormhole_id`);
 
 CREATE TABLE IF NOT EXISTS `wormhole_links` (
     `wormhole_id` TEXT NOT NULL,
@@ -25,10 +26,31 @@ CREATE TABLE IF NOT EXISTS `wormhole_links` (
     `webhook_avatar` TEXT NOT NULL DEFAULT 'user'
 );
 CREATE INDEX IF NOT EXISTS idx_wormhole_links ON `wormhole_links` (`wormhole_id`);
+CREATE INDEX IF NOT EXISTS idx_wormhole_links_channel ON `wormhole_links` (`channel_id`, `wormhole_id`);
 
 CREATE TABLE IF NOT EXISTS `wormhole_webhooks` (
     `id` BIGINT NOT NULL,
     `token` TEXT NOT NULL,
     `channel_id` BIGINT NOT NULL
 );
-CREATE INDEX IF NOT EXISTS idx_wormhole_webhooks ON `wormhole_webhooks` (`id`);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_wormhole_webhooks ON `wormhole_webhooks` (`id`);
+CREATE INDEX IF NOT EXISTS idx_wormhole_webhooks_channel ON `wormhole_webhooks` (`channel_id`);
+
+CREATE TABLE IF NOT EXISTS `wormhole_mirors` (
+    `original_id` BIGINT NOT NULL,
+    `original_channel_id` BIGINT NOT NULL,
+    `miror_id` BIGINT NOT NULL,
+    `miror_channel_id` BIGINT NOT NULL,
+    `fingerprint` BIGINT
+);
+CREATE INDEX IF NOT EXISTS idx_wormhole_mirors ON `wormhole_mirors` (`original_id`);
+CREATE INDEX IF NOT EXISTS idx_wormhole_mirors_miror ON `wormhole_mirors` (`miror_id`);
+
+CREATE TABLE IF NOT EXISTS `wormhole_threads` (
+    `original_thread_id` BIGINT NOT NULL,
+    `original_channel_id` BIGINT NOT NULL,
+    `miror_thread_id` BIGINT NOT NULL,
+    `miror_channel_id` BIGINT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_wormhole_threads ON `wormhole_threads` (`original_thread_id`);
+CREATE INDEX IF NOT EXISTS idx_wormhole_threads_miror ON `wormhole_threads` (`miror_thread_id`);
\ No newline at end of file
@@ -0,0 +1,141 @@
+#==============================================================================
+# Requirements
+#==============================================================================
+
+# Standard libs ---------------------------------------------------------------
+
+import asyncio
+import io
+import os
+import tempfile
+
+# Third party libs ------------------------------------------------------------
+
+import discord
+from LRFutils import logs
+
+#==============================================================================
+# Attachments
+#==============================================================================
+
+class WhAttachments:
+
+    # Attachments bigger than this are kept in a temporary file (in bytes)
+    spool_size = 8 * 1024 * 1024
+
+    # Attachments bigger than this are only mirrored as links (in bytes)
+    max_size = 25 * 1024 * 1024
+
+    # Maximum size of the attachments kept in memory at once (in bytes)
+    memory_budget = 64 * 1024 * 1024
+
+    # Size of the attachments currently kept in memory (in bytes)
+    memory_used = 0
+
+    def __init__(self):
+        """--------------------------------------------------------------------
+        Create an empty set of downloaded attachments
+        --------------------------------------------------------------------"""
+
+        # (attachment, bytes or temporary file path)
+        self.downloaded:list[tuple[discord.Attachment, bytes|str]] = []
+        self.links:list[str] = []
+        self.memory = 0
+
+    @staticmethod
+    async def download(message:discord.Message) -> "WhAttachments":
+        """--------------------------------------------------------------------
+        Download the attachments of a message once, so that they can be
+        uploaded to every destination without being downloaded again.
+
+        Parameters
+        ----------
+        - `message` : The message to download the attachments of
+
+        Returns
+        -------
+        - The downloaded attachments
+        --------------------------------------------------------------------"""
+
+        attachments = WhAttachments()
+
+        async def download_one(attachment:discord.Attachment):
+
+            # Too big to be uploaded again
+            if attachment.size > WhAttachments.max_size:
+                attachments.links.append(attachment.url)
+                return
+
+            # Big enough to be kept on disk
+            if attachment.size > WhAttachments.spool_size:
+                fd, path = tempfile.mkstemp(prefix="wormhole-")
+                attachments.downloaded.append((attachment, path))
+                with os.fdopen(fd, "wb") as file:
+                    await attachment.save(file)
+                return
+
+            # Memory budget exceeded
+            if WhAttachments.memory_used + attachment.size \
+                > WhAttachments.memory_budget:
+                logs.warning(
+                    "Wormhole > Attachment memory budget exceeded, "\
+                    + f"mirroring {attachment.filename} as a link"
+                )
+                attachments.links.append(attachment.url)
+                return
+
+            WhAttachments.memory_used += attachment.size
+            attachments.memory += attachment.size
+            data = await attachment.read()
+            attachments.downloaded.append((attachment, data))
+
+        try:
+            await asyncio.gather(
+                *(download_one(a) for a in message.attachments)
+            )
+        except BaseException:
+            attachments.close()
+            raise
+
+        # Keep the original order of the attachments
+        order = {a.id: i for i, a in enumerate(message.attachments)}
+        attachments.downloaded.sort(key=lambda d: order[d[0].id])
+
+        return attachments
+
+    def files(self) -> list[discord.File]:
+        """--------------------------------------------------------------------
+        Return new files reading the downloaded attachments. Each destination
+        needs its own files, but they all share the same downloaded data.
+
+        Returns
+        -------
+        - The files to upload
+        --------------------------------------------------------------------"""
+
+        return [
+            discord.File(
+                # BytesIO shares the bytes buffer as long as it isn't written
+                io.BytesIO(data) if isinstance(data, bytes) else data,
+                filename=attachment.filename,
+                spoiler=attachment.is_spoiler(),
+                description=attachment.description
+            )
+            for attachment, data in self.downloaded
+        ]
+
+    def close(self) -> None:
+        """--------------------------------------------------------------------
+        Release the memory and the temporary files of the attachments
+        --------------------------------------------------------------------"""
+
+        WhAttachments.memory_used -= self.memory
+        self.memory = 0
+
+        for _, data in self.downloaded:
+            if isinstance(data, str):
+                try:
+                    os.remove(data)
+                except OSError:
+                    pass
+        self.downloaded = []
@@ -1,9 +1,36 @@
 from typing import Optional
+import datetime
+import weakref
 import discord
 from LRFutils import logs
-import allay
+from .database import WhBatch, WhDatabase
+from .cache import LRUCache
 
-class Wormhole:
+class WhRecord:
+    """------------------------------------------------------------------------
+    Base of the models shared through an identity map. Their attributes can
+    only be set once: a changed row gives a new instance instead.
+    ------------------------------------------------------------------------"""
+
+    __slots__ = ()
+
+    def __setattr__(self, name:str, value) -> None:
+        if hasattr(self, name):
+            raise AttributeError(
+                f"{type(self).__name__}.{name} is read-only"
+            )
+        object.__setattr__(self, name, value)
+
+class Wormhole(WhRecord):
+
+    __slots__ = ("id", "name", "sync_threads", "__weakref__")
+
+    # Wormhole ID -> live instance, so that a same row gives a same object
+    instances:"weakref.WeakValueDictionary[int, Wormhole]" \
+        = weakref.WeakValueDictionary()
+
+    # User ID -> (search key, wormhole) of the wormholes the user is admin of
+    accessible_cache = LRUCache(maxsize=10000)
 
     def __init__(self, id:int, name:str, sync_threads:bool):
         self.id = int(id)
@@ -11,7 +38,31 @@ class Wormhole:
         self.sync_threads = bool(sync_threads)
 
     @staticmethod
-    def open(name:str, sync_threads:bool=True) -> int:
+    def from_row(data:dict) -> "Wormhole":
+        """--------------------------------------------------------------------
+        Return the wormhole of a database row, reusing the live instance of
+        this row if it is still up to date
+        
+        Parameters
+        ----------
+        - `data` : The database row
+        
+        Returns
+        -------
+        - The wormhole
+        --------------------------------------------------------------------"""
+
+        id = int(data['id'])
+        wormhole = Wormhole.instances.get(id)
+        if wormhole is None \
+            or wormhole.name != data['name'] \
+            or wormhole.sync_threads != bool(data['sync_threads']):
+            wormhole = Wormhole(**data)
+            Wormhole.instances[id] = wormhole
+        return wormhole
+
+    @staticmethod
+    async def open(name:str, sync_threads:bool=True) -> int:
         """--------------------------------------------------------------------
         Open a new wormhole (add it to the database) and return its ID
         
@@ -25,15 +76,20 @@ class Wormhole:
         - The ID of the newly created wormhole
         --------------------------------------------------------------------"""
 
-        wormhole_id = allay.Database.query(
+        wormhole_id = await WhDatabase.query(
             f"INSERT INTO wormholes (name, sync_threads) VALUES (?,?)",
             (name, sync_threads)
         ) 
 
-        return Wormhole(wormhole_id, name, sync_threads)
+        wormhole = Wormhole.from_row(
+            {'id': wormhole_id, 'name': name, 'sync_threads': sync_threads}
+        )
+        WhRouter.add_wormhole(wormhole)
+
+        return wormhole
     
     @staticmethod
-    def all():
+    async def all():
         """--------------------------------------------------------------------
         Return a list of all wormholes in the database
         
@@ -43,7 +99,7 @@ class Wormhole:
         --------------------------------------------------------------------"""
 
         return [
-            Wormhole(**data) for data in allay.Database.query(
+            Wormhole.from_row(data) for data in await WhDatabase.query(
                 f"SELECT * FROM wormholes"
             )
         ]
@@ -53,7 +109,7 @@ class Wormhole:
     #==========================================================================
 
     @staticmethod
-    def get_by_id(id) -> Optional["Wormhole"]:
+    async def get_by_id(id) -> Optional["Wormhole"]:
         """--------------------------------------------------------------------
         Return a wormhole by its ID
         
@@ -66,14 +122,15 @@ class Wormhole:
         - The wormhole with the given ID, or None if it doesn't exist
         --------------------------------------------------------------------"""
 
-        for wormhole in Wormhole.all():
-            if wormhole.id == id:
-                return wormhole
-            
-        return None
+        rows = await WhDatabase.query(
+            "SELECT * FROM wormholes WHERE id=?",
+            (id,)
+        )
+
+        return Wormhole.from_row(rows[0]) if rows else None
 
     @staticmethod
-    def get_accessible_by(user:discord.User) -> list["Wormhole"]:
+    async def get_accessible_by(user:discord.User) -> list["Wormhole"]:
         """--------------------------------------------------------------------
         Return a list of all wormholes the user is admin of
         
@@ -86,16 +143,73 @@ class Wormhole:
         - A list of all wormholes the user is admin of
         --------------------------------------------------------------------"""
 
-        wormholes = []
-        for admin in WhAdmin.all():
-            if admin.user_id == user.id:
-                wormholes.append(Wormhole.get_by_id(admin.wormhole_id))
+        return [
+            wormhole for _, wormhole in await Wormhole._get_accessible(user)
+        ]
+
+    @staticmethod
+    async def search_accessible_by(
+            user:discord.User,
+            search:str,
+            limit:int=25
+        ) -> list["Wormhole"]:
+        """--------------------------------------------------------------------
+        Return the wormholes the user is admin of whose display name contains
+        a search string, the ones starting with it first
+        
+        Parameters
+        ----------
+        - `user` : The user to check
+        - `search` : The string to search (case insensitive)
+        - `limit` : The maximum number of wormholes to return
+        
+        Returns
+        -------
+        - A list of the matching wormholes
+        --------------------------------------------------------------------"""
+
+        search = search.lower()
+        starting, containing = [], []
+        for key, wormhole in await Wormhole._get_accessible(user):
+            if key.startswith(search):
+                starting.append(wormhole)
+            elif search in key:
+                containing.append(wormhole)
+
+        return (starting + containing)[:limit]
+
+    @staticmethod
+    async def _get_accessible(
+            user:discord.User
+        ) -> tuple[tuple[str, "Wormhole"], ...]:
+        """--------------------------------------------------------------------
+        Return the cached search entries of the wormholes the user is admin of,
+        loading them if needed
+        
+        Parameters
+        ----------
+        - `user` : The user to check
+        
+        Returns
+        -------
+        - The (lowercased display name, wormhole) of each wormhole
+        --------------------------------------------------------------------"""
+
+        entries = Wormhole.accessible_cache.get(user.id)
+        if entries is None:
+            # The routing table also knows the admins that are not written yet
+            entries = tuple(
+                (str(wormhole).lower(), wormhole)
+                for wormhole_id, wormhole in WhRouter.wormholes.items()
+                if user.id in WhRouter.admins.get(wormhole_id, ())
+            )
+            Wormhole.accessible_cache.put(user.id, entries)
 
-        return wormholes
+        return entries
 
     # Get wormholes linked to a specific channel
     @staticmethod
-    def get_linked_to(
+    async def get_linked_to(
             channel:discord.abc.GuildChannel,
             filter_can_read=False,
             filter_can_write=False
@@ -116,29 +230,24 @@ class Wormhole:
         - A list of all wormholes linked to the channel
         --------------------------------------------------------------------"""
 
-        wormholes = []
-        for link in WhLink.all():
-
-            if link.channel_id != channel.id:
-                continue
-
-            wormhole = Wormhole.get_by_id(link.wormhole_id)
-            if wormhole:
-                if (
-                    not filter_can_read
-                    or (filter_can_read and link.can_read)
-                    ) and (
-                    not filter_can_write
-                    or (filter_can_write and link.can_write)
-                ):
-                    wormholes.append(wormhole)
+        query = "SELECT wormholes.* FROM wormhole_links "\
+            + "JOIN wormholes ON wormholes.id = wormhole_links.wormhole_id "\
+            + "WHERE wormhole_links.channel_id=?"
+        if filter_can_read:
+            query += " AND wormhole_links.can_read"
+        if filter_can_write:
+            query += " AND wormhole_links.can_write"
 
-        return wormholes
+        return [
+            Wormhole.from_row(data)
+            for data in await WhDatabase.query(query, (channel.id,))
+        ]
 
     @staticmethod
     def get_linked_in(guild:discord.Guild) -> list["Wormhole"]:
         """--------------------------------------------------------------------
-        Return a list of all wormholes linked in a specific guild
+        Return a list of all wormholes linked in a specific guild, without
+        duplicates
         
         Parameters
         ----------
@@ -149,14 +258,14 @@ class Wormhole:
         - A list of all wormholes linked in the guild
         --------------------------------------------------------------------"""
 
-        wormholes = []
-        for link in WhLink.all():
-            if guild.get_channel(link.channel_id):
-                wormhole = Wormhole.get_by_id(link.wormhole_id)
-                if wormhole:
-                    wormholes.append(wormhole)
+        wormholes = {}
+        for channel_id in WhRouter.get_channels_in(guild):
+            for wormhole_id in WhRouter.channels.get(channel_id, ()):
+                wormhole = WhRouter.wormholes.get(wormhole_id)
+                if wormhole is not None:
+                    wormholes.setdefault(wormhole_id, wormhole)
 
-        return wormholes
+        return list(wormholes.values())
     
     #==========================================================================
     # Others
@@ -172,7 +281,7 @@ class Wormhole:
         - A list of all links of the wormhole
         --------------------------------------------------------------------"""
 
-        return WhLink.get_from(self)
+        return list(WhRouter.links.get(self.id, []))
 
     @property
     def linked_channels_id(self) -> list[int]:
@@ -248,7 +357,21 @@ class Wormhole:
             + "name:{self.name} "\
             + "sync_threads:{self.sync_threads}>"
 
-class WhLink:
+class WhLink(WhRecord):
+
+    __slots__ = (
+        "wormhole_id",
+        "channel_id",
+        "can_read",
+        "can_write",
+        "webhook_name",
+        "webhook_avatar",
+        "__weakref__"
+    )
+
+    # (Wormhole ID, channel ID) -> live instance
+    instances:"weakref.WeakValueDictionary[tuple[int, int], WhLink]" \
+        = weakref.WeakValueDictionary()
 
     def __init__(
             self,
@@ -282,17 +405,46 @@ class WhLink:
         else:
             channel_id = int(channel_id)
 
+        self.wormhole_id = wormhole_id
+        self.channel_id = channel_id
         self.can_read = bool(can_read)
         self.can_write = bool(can_write)
         self.webhook_name = str(webhook_name)
         self.webhook_avatar = str(webhook_avatar)
 
     @staticmethod
-    def add(
+    def from_row(data:dict) -> "WhLink":
+        """--------------------------------------------------------------------
+        Return the link of a database row, reusing the live instance of this
+        row if it is still up to date
+        
+        Parameters
+        ----------
+        - `data` : The database row
+        
+        Returns
+        -------
+        - The link
+        --------------------------------------------------------------------"""
+
+        key = (int(data['wormhole_id']), int(data['channel_id']))
+        link = WhLink.instances.get(key)
+        if link is None \
+            or link.can_read != bool(data['can_read']) \
+            or link.can_write != bool(data['can_write']) \
+            or link.webhook_name != str(data.get('webhook_name')) \
+            or link.webhook_avatar != str(data.get('webhook_avatar')):
+            link = WhLink(**data)
+            WhLink.instances[key] = link
+        return link
+
+    @staticmethod
+    async def add(
             wormhole:int|Wormhole,
             channel:int|discord.abc.GuildChannel,
             read:bool=True,
-            write:bool=False
+            write:bool=False,
+            batch:WhBatch=None
         ) -> "WhLink":
         """--------------------------------------------------------------------
         Create a new link between a wormhole and a channel
@@ -303,44 +455,62 @@ class WhLink:
         - `channel` : The channel to link
         - `read` : Whether or not the channel can read in the wormhole
         - `write` : Whether or not the channel can write in the wormhole
+        - `batch` : The batch to add the insertion to, if any
         
         Returns
         -------
         - The newly created link
         --------------------------------------------------------------------"""
 
-        # Check if the link already exist
-        for link in WhLink.all():
-            if link.wormhole_id == wormhole and link.channel_id == channel:
-                return link
-        
-        # If not, create it
         if isinstance(wormhole, Wormhole):
             wormhole = wormhole.id
         if isinstance(channel, discord.abc.GuildChannel):
             channel = channel.id
 
-        query = "INSERT INTO wormhole_links "\
-            + "(wormhole_id, channel_id, can_read, can_write) VALUES (?,?,?,?)"
-        allay.Database.query(query, (wormhole, channel, read, write))
-
-        link = WhLink(wormhole, channel, read, write)
-        WhLink.all().append(link)
+        # Check if the link already exist (the routing table also knows the
+        # links that are not written yet)
+        for link in WhRouter.links.get(wormhole, []):
+            if link.channel_id == channel:
+                return link
+        
+        # If not, create it
+        await WhDatabase.insert(
+            "wormhole_links",
+            ("wormhole_id", "channel_id", "can_read", "can_write"),
+            (wormhole, channel, read, write),
+            batch
+        )
+
+        link = WhLink.from_row({
+            'wormhole_id': wormhole,
+            'channel_id': channel,
+            'can_read': read,
+            'can_write': write
+        })
+        WhRouter.add_link(link)
 
         return link
 
-    def remove(self):
-        allay.Database.query(
-            f"DELETE FROM wormhole_links WHERE "\
-                + "wormhole_id={self.wormhole_id} "\
-                + "AND channel_id={self.channel_id}"
-            )
-        if self in WhLink.all():
-            WhLink.all().remove(self)
-        del self
+    async def remove(self, batch:WhBatch=None):
+        """--------------------------------------------------------------------
+        Remove the link from the database and from the routing table
+        
+        Parameters
+        ----------
+        - `batch` : The batch to add the deletion to, if any
+        --------------------------------------------------------------------"""
+
+        await WhDatabase.delete(
+            "wormhole_links",
+            ("wormhole_id", "channel_id"),
+            (self.wormhole_id, self.channel_id),
+            batch
+        )
+        WhLink.instances.pop((self.wormhole_id, self.channel_id), None)
+        WhRouter.remove_link(self)
 
     @staticmethod
-    def all() -> list["WhLink"]:
+    async def all() -> list["WhLink"]:
         """--------------------------------------------------------------------
         Return a list of all links in the database
         
@@ -350,7 +520,7 @@ class WhLink:
         --------------------------------------------------------------------"""
 
         return [
-            WhLink(**data) for data in allay.Database.query(
+            WhLink.from_row(data) for data in await WhDatabase.query(
                 f"SELECT * FROM wormhole_links"
             )
         ]
@@ -360,7 +530,7 @@ class WhLink:
     #==========================================================================
 
     @staticmethod
-    def get_from(wormhole:Wormhole) -> list["WhLink"]:
+    async def get_from(wormhole:Wormhole) -> list["WhLink"]:
         """--------------------------------------------------------------------
         Return a list of all links of a wormhole
         
@@ -373,14 +543,20 @@ class WhLink:
         - A list of all links of the wormhole
         --------------------------------------------------------------------"""
 
-        links = []
-        for link in WhLink.all():
-            if link.wormhole_id == wormhole.id:
-                links.append(link)
+        return [
+            WhLink.from_row(data) for data in await WhDatabase.query(
+                "SELECT * FROM wormhole_links WHERE wormhole_id=?",
+                (wormhole.id,)
+            )
+        ]
 
-        return links
+class WhAdmin(WhRecord):
 
-class WhAdmin:
+    __slots__ = ("user_id", "wormhole_id", "__weakref__")
+
+    # (Wormhole ID, user ID) -> live instance
+    instances:"weakref.WeakValueDictionary[tuple[int, int], WhAdmin]" \
+        = weakref.WeakValueDictionary()
 
     def __init__(self, user_id:int|discord.abc.User, wormhole_id:int|Wormhole):
         """--------------------------------------------------------------------
@@ -402,10 +578,36 @@ class WhAdmin:
         else:
             user_id = int(user_id)
 
+        self.user_id = user_id
+        self.wormhole_id = wormhole_id
+
     @staticmethod
-    def add(
+    def from_row(data:dict) -> "WhAdmin":
+        """--------------------------------------------------------------------
+        Return the admin of a database row, reusing the live instance of this
+        row if there is one
+        
+        Parameters
+        ----------
+        - `data` : The database row
+        
+        Returns
+        -------
+        - The admin
+        --------------------------------------------------------------------"""
+
+        key = (int(data['wormhole_id']), int(data['user_id']))
+        admin = WhAdmin.instances.get(key)
+        if admin is None:
+            admin = WhAdmin(**data)
+            WhAdmin.instances[key] = admin
+        return admin
+
+    @staticmethod
+    async def add(
             wormhole_id:int|Wormhole,
-            user_id:int|discord.abc.User
+            user_id:int|discord.abc.User,
+            batch:WhBatch=None
         ) -> "WhAdmin":
         """--------------------------------------------------------------------
         Create a new wormhole admin (stored in the database)
@@ -414,31 +616,70 @@ class WhAdmin:
         ----------
         - `wormhole_id` : The ID of the wormhole to make admin of
         - `user_id` : The ID of the user to make admin
+        - `batch` : The batch to add the insertion to, if any
         
         Returns
         -------
         - The newly created admin
         --------------------------------------------------------------------"""
 
-        # Check if the admin already exist
-        for admin in WhAdmin.all():
-            if admin.wormhole_id == wormhole_id and admin.user_id == user_id:
-                return admin
+        if isinstance(user_id, discord.abc.User):
+            user_id = user_id.id
+        if isinstance(wormhole_id, Wormhole):
+            wormhole_id = wormhole_id.id
+
+        # Check if the admin already exist (the routing table also knows the
+        # admins that are not written yet)
+        admin = WhRouter.admins.get(wormhole_id, {}).get(user_id)
+        if admin is not None:
+            return admin
         
         # If not, create it
+        await WhDatabase.insert(
+            "wormhole_admins",
+            ("wormhole_id", "user_id"),
+            (wormhole_id, user_id),
+            batch
+        )
+        admin = WhAdmin.from_row(
+            {'user_id': user_id, 'wormhole_id': wormhole_id}
+        )
+        WhRouter.add_admin(admin)
+
+        return admin
+    
+    @staticmethod
+    async def remove(
+            wormhole_id:int|Wormhole,
+            user_id:int|discord.abc.User,
+            batch:WhBatch=None
+        ) -> None:
+        """--------------------------------------------------------------------
+        Remove a wormhole admin from the database
+        
+        Parameters
+        ----------
+        - `wormhole_id` : The ID of the wormhole to remove the admin from
+        - `user_id` : The ID of the user to remove
+        - `batch` : The batch to add the deletion to, if any
+        --------------------------------------------------------------------"""
+
         if isinstance(user_id, discord.abc.User):
             user_id = user_id.id
         if isinstance(wormhole_id, Wormhole):
             wormhole_id = wormhole_id.id
 
-        query = "INSERT INTO wormhole_admins "\
-            + "(wormhole_id, user_id) VALUES (?,?)"
-        allay.Database.query(query, (wormhole_id, user_id))
+        await WhDatabase.delete(
+            "wormhole_admins",
+            ("wormhole_id", "user_id"),
+            (wormhole_id, user_id),
+            batch
+        )
+        WhAdmin.instances.pop((wormhole_id, user_id), None)
+        WhRouter.remove_admin(wormhole_id, user_id)
 
-        return WhAdmin(user_id, wormhole_id)   
-    
     @staticmethod
-    def all():
+    async def all():
         """--------------------------------------------------------------------
         Return a list of all wormhole admins in the database
         
@@ -448,7 +689,7 @@ class WhAdmin:
         --------------------------------------------------------------------"""
 
         return [
-            WhAdmin(**data) for data in allay.Database.query(
+            WhAdmin.from_row(data) for data in await WhDatabase.query(
                 f"SELECT * FROM wormhole_admins"
             )
         ]
@@ -458,7 +699,7 @@ class WhAdmin:
     #==========================================================================
 
     @staticmethod
-    def get_from(wormhole:Wormhole) -> list["WhAdmin"]:
+    async def get_from(wormhole:Wormhole) -> list["WhAdmin"]:
         """--------------------------------------------------------------------
         Return a list of all admins of a wormhole
         
@@ -471,12 +712,28 @@ class WhAdmin:
         - A list of all admins of the wormhole
         --------------------------------------------------------------------"""
 
-        admins = []
-        for admin in WhAdmin.all():
-            if admin.wormhole_id == wormhole.id:
-                admins.append(admin)
+        return list(WhRouter.admins.get(wormhole.id, {}).values())
+
+    @staticmethod
+    async def get_from_all(
+            wormholes:list[Wormhole]
+        ) -> dict[int, list["WhAdmin"]]:
+        """--------------------------------------------------------------------
+        Return the admins of several wormholes
+        
+        Parameters
+        ----------
+        - `wormholes` : The wormholes to check
+        
+        Returns
+        -------
+        - The lists of admins, indexed by wormhole ID
+        --------------------------------------------------------------------"""
 
-        return admins
+        return {
+            wormhole.id: await WhAdmin.get_from(wormhole)
+            for wormhole in wormholes
+        }
 
     #==========================================================================
     # Others
@@ -504,4 +761,686 @@ class WhAdmin:
 
         return f"<WhAdmin "\
             + "user_id:{self.user_id} "\
-            + "wormhole_id:{self.wormhole_id}>"
\ No newline at end of file
+            + "wormhole_id:{self.wormhole_id}>"
+
+class WhMiror:
+
+    # Maximum number of IDs given to a single "IN (...)" query
+    chunk_size = 400
+
+    # Age of the original messages whose mirors are forgotten
+    retention = datetime.timedelta(days=30)
+
+    def __init__(
+            self,
+            original_id:int,
+            original_channel_id:int,
+            miror_id:int,
+            miror_channel_id:int,
+            fingerprint:int=None
+        ):
+        """--------------------------------------------------------------------
+        Create a virtual link between an original message and one of its
+        mirors (not stored in the database)
+        
+        Parameters
+        ----------
+        - `original_id` : The ID of the original message
+        - `original_channel_id` : The ID of the channel of the original message
+        - `miror_id` : The ID of the miror message
+        - `miror_channel_id` : The ID of the channel of the miror message
+        - `fingerprint` : The fingerprint of the original message, if known
+        --------------------------------------------------------------------"""
+
+        self.original_id = int(original_id)
+        self.original_channel_id = int(original_channel_id)
+        self.miror_id = int(miror_id)
+        self.miror_channel_id = int(miror_channel_id)
+        self.fingerprint = None if fingerprint is None else int(fingerprint)
+
+    @staticmethod
+    async def add(
+            original:discord.Message,
+            miror:discord.Message,
+            fingerprint:int=None,
+            batch:WhBatch=None
+        ) -> "WhMiror":
+        """--------------------------------------------------------------------
+        Store the link between an original message and one of its mirors
+        
+        Parameters
+        ----------
+        - `original` : The original message
+        - `miror` : The miror message
+        - `fingerprint` : The fingerprint of the original message, computed
+        once for all its mirors
+        - `batch` : The batch to add the insertion to, if any
+        
+        Returns
+        -------
+        - The newly created miror link
+        --------------------------------------------------------------------"""
+
+        miror = WhMiror(
+            original.id,
+            original.channel.id,
+            miror.id,
+            miror.channel.id,
+            fingerprint
+        )
+
+        await WhDatabase.insert(
+            "wormhole_mirors",
+            (
+                "original_id",
+                "original_channel_id",
+                "miror_id",
+                "miror_channel_id",
+                "fingerprint"
+            ),
+            (
+                miror.original_id,
+                miror.original_channel_id,
+                miror.miror_id,
+                miror.miror_channel_id,
+                miror.fingerprint
+            ),
+            batch
+        )
+
+        return miror
+
+    @staticmethod
+    async def remove(original_id:int) -> None:
+        """--------------------------------------------------------------------
+        Forget all the mirors of an original message
+        
+        Parameters
+        ----------
+        - `original_id` : The ID of the original message
+        --------------------------------------------------------------------"""
+
+        await WhDatabase.query(
+            "DELETE FROM wormhole_mirors WHERE original_id=?",
+            (original_id,)
+        )
+
+    @staticmethod
+    async def remove_all(originals_id:list[int]) -> None:
+        """--------------------------------------------------------------------
+        Forget all the mirors of several original messages
+        
+        Parameters
+        ----------
+        - `originals_id` : The IDs of the original messages
+        --------------------------------------------------------------------"""
+
+        originals_id = list(originals_id)
+        for i in range(0, len(originals_id), WhMiror.chunk_size):
+            chunk = originals_id[i:i+WhMiror.chunk_size]
+            await WhDatabase.query(
+                "DELETE FROM wormhole_mirors WHERE original_id IN "\
+                    + f"({','.join('?' * len(chunk))})",
+                tuple(chunk)
+            )
+
+    @staticmethod
+    async def prune(before:datetime.datetime=None) -> None:
+        """--------------------------------------------------------------------
+        Forget the mirors of the original messages sent before a date. Message
+        IDs grow with their creation date, so the index of the original IDs
+        is used.
+        
+        Parameters
+        ----------
+        - `before` : The date (default to `WhMiror.retention` ago)
+        --------------------------------------------------------------------"""
+
+        if before is None:
+            before = discord.utils.utcnow() - WhMiror.retention
+
+        await WhDatabase.query(
+            "DELETE FROM wormhole_mirors WHERE original_id < ?",
+            (discord.utils.time_snowflake(before),)
+        )
+
+    @staticmethod
+    async def set_fingerprint(original_id:int, fingerprint:int) -> None:
+        """--------------------------------------------------------------------
+        Update the fingerprint of all the mirors of an edited original message
+
+        Parameters
+        ----------
+        - `original_id` : The ID of the original message
+        - `fingerprint` : The new fingerprint of the original message
+        --------------------------------------------------------------------"""
+
+        await WhDatabase.query(
+            "UPDATE wormhole_mirors SET fingerprint=? WHERE original_id=?",
+            (fingerprint, original_id)
+        )
+
+    #==========================================================================
+    # Getters
+    #==========================================================================
+
+    @staticmethod
+    async def get_original(message_id:int) -> Optional[tuple[int, int]]:
+        """--------------------------------------------------------------------
+        Return the original message of a miror message
+        
+        Parameters
+        ----------
+        - `message_id` : The ID of the miror message
+        
+        Returns
+        -------
+        - The IDs of the original message and of its channel, or None if the
+        message is not a known miror
+        --------------------------------------------------------------------"""
+
+        rows = await WhDatabase.query(
+            "SELECT original_id, original_channel_id FROM wormhole_mirors "\
+                + "WHERE miror_id=? LIMIT 1",
+            (message_id,)
+        )
+        if rows:
+            return int(rows[0]['original_id']), \
+                int(rows[0]['original_channel_id'])
+        return None
+
+    @staticmethod
+    async def get_from(original_id:int) -> list["WhMiror"]:
+        """--------------------------------------------------------------------
+        Return all the mirors of an original message
+        
+        Parameters
+        ----------
+        - `original_id` : The ID of the original message
+        
+        Returns
+        -------
+        - A list of all the mirors of the message
+        --------------------------------------------------------------------"""
+
+        return [
+            WhMiror(**data) for data in await WhDatabase.query(
+                "SELECT * FROM wormhole_mirors WHERE original_id=?",
+                (original_id,)
+            )
+        ]
+
+    @staticmethod
+    async def get_in(original_id:int, channel_id:int) -> Optional[int]:
+        """--------------------------------------------------------------------
+        Return the miror of an original message in a specific channel
+        
+        Parameters
+        ----------
+        - `original_id` : The ID of the original message
+        - `channel_id` : The ID of the channel of the miror
+        
+        Returns
+        -------
+        - The ID of the miror message, or None if there is no miror in this
+        channel
+        --------------------------------------------------------------------"""
+
+        rows = await WhDatabase.query(
+            "SELECT miror_id FROM wormhole_mirors "\
+                + "WHERE original_id=? AND miror_channel_id=? LIMIT 1",
+            (original_id, channel_id)
+        )
+        return int(rows[0]['miror_id']) if rows else None
+
+    @staticmethod
+    async def get_family(messages_id:list[int]) -> list["WhMiror"]:
+        """--------------------------------------------------------------------
+        Return all the miror links related to some messages, whether they are
+        originals or mirors
+        
+        Parameters
+        ----------
+        - `messages_id` : The IDs of the messages
+        
+        Returns
+        -------
+        - A list of all the miror links of the originals of the messages
+        --------------------------------------------------------------------"""
+
+        messages_id = list(messages_id)
+        mirors = []
+        for i in range(0, len(messages_id), WhMiror.chunk_size):
+            chunk = tuple(messages_id[i:i+WhMiror.chunk_size])
+            placeholders = ','.join('?' * len(chunk))
+            mirors += [
+                WhMiror(**data) for data in await WhDatabase.query(
+                    "SELECT * FROM wormhole_mirors "\
+                        + f"WHERE original_id IN ({placeholders}) "\
+                        + "OR original_id IN ("\
+                        + "SELECT original_id FROM wormhole_mirors "\
+                        + f"WHERE miror_id IN ({placeholders}))",
+                    chunk + chunk
+                )
+            ]
+
+        return mirors
+
+
+class WhThread:
+
+    # Thread ID -> known threads of its family, shared by all its members
+    families = LRUCache(maxsize=10000)
+
+    def __init__(
+            self,
+            original_thread_id:int,
+            original_channel_id:int,
+            miror_thread_id:int,
+            miror_channel_id:int
+        ):
+        """--------------------------------------------------------------------
+        Create a virtual link between an original thread and one of its
+        mirors (not stored in the database)
+        
+        Parameters
+        ----------
+        - `original_thread_id` : The ID of the original thread
+        - `original_channel_id` : The ID of the parent of the original thread
+        - `miror_thread_id` : The ID of the miror thread
+        - `miror_channel_id` : The ID of the parent of the miror thread
+        --------------------------------------------------------------------"""
+
+        self.original_thread_id = int(original_thread_id)
+        self.original_channel_id = int(original_channel_id)
+        self.miror_thread_id = int(miror_thread_id)
+        self.miror_channel_id = int(miror_channel_id)
+
+    @staticmethod
+    async def add(
+            thread:discord.Thread,
+            miror_thread_id:int,
+            miror_channel_id:int,
+            batch:WhBatch=None
+        ) -> "WhThread":
+        """--------------------------------------------------------------------
+        Store the link between a thread and one of its mirors. If the thread
+        is itself a miror, the new miror is linked to its original.
+        
+        Parameters
+        ----------
+        - `thread` : The thread the miror is created from
+        - `miror_thread_id` : The ID of the miror thread
+        - `miror_channel_id` : The ID of the parent of the miror thread
+        - `batch` : The batch to add the insertion to, if any
+        
+        Returns
+        -------
+        - The newly created thread link
+        --------------------------------------------------------------------"""
+
+        family = await WhThread.get_family(thread.id)
+        if family:
+            original_thread_id = family[0].original_thread_id
+            original_channel_id = family[0].original_channel_id
+        else:
+            original_thread_id = thread.id
+            original_channel_id = thread.parent_id
+
+        link = WhThread(
+            original_thread_id,
+            original_channel_id,
+            miror_thread_id,
+            miror_channel_id
+        )
+
+        await WhDatabase.insert(
+            "wormhole_threads",
+            (
+                "original_thread_id",
+                "original_channel_id",
+                "miror_thread_id",
+                "miror_channel_id"
+            ),
+            (
+                link.original_thread_id,
+                link.original_channel_id,
+                link.miror_thread_id,
+                link.miror_channel_id
+            ),
+            batch
+        )
+
+        family.append(link)
+        WhThread.families.put(original_thread_id, family)
+        WhThread.families.put(link.miror_thread_id, family)
+
+        return link
+
+    @staticmethod
+    async def remove(thread_id:int) -> None:
+        """--------------------------------------------------------------------
+        Forget a deleted thread. If it is an original thread, its mirors are
+        no longer linked to each other.
+        
+        Parameters
+        ----------
+        - `thread_id` : The ID of the deleted thread
+        --------------------------------------------------------------------"""
+
+        family = await WhThread.get_family(thread_id)
+        for link in family:
+            WhThread.families.discard(link.original_thread_id)
+            WhThread.families.discard(link.miror_thread_id)
+        WhThread.families.discard(thread_id)
+
+        await WhDatabase.query(
+            "DELETE FROM wormhole_threads "\
+                + "WHERE original_thread_id=? OR miror_thread_id=?",
+            (thread_id, thread_id)
+        )
+
+    #==========================================================================
+    # Getters
+    #==========================================================================
+
+    @staticmethod
+    async def get_family(thread_id:int) -> list["WhThread"]:
+        """--------------------------------------------------------------------
+        Return all the thread links of the original of a thread, whether the
+        thread is an original or a miror
+        
+        Parameters
+        ----------
+        - `thread_id` : The ID of the thread
+        
+        Returns
+        -------
+        - A list of all the links of the original thread, empty if the
+        thread has no miror yet
+        --------------------------------------------------------------------"""
+
+        family = WhThread.families.get(thread_id)
+        if family is not None:
+            return family
+
+        family = [
+            WhThread(**data) for data in await WhDatabase.query(
+                "SELECT * FROM wormhole_threads "\
+                    + "WHERE original_thread_id=? OR original_thread_id IN ("\
+                    + "SELECT original_thread_id FROM wormhole_threads "\
+                    + "WHERE miror_thread_id=?)",
+                (thread_id, thread_id)
+            )
+        ]
+        WhThread.families.put(thread_id, family)
+        return family
+
+    @staticmethod
+    async def get_in(thread_id:int, channel_id:int) -> Optional[int]:
+        """--------------------------------------------------------------------
+        Return the miror of a thread in a specific channel
+        
+        Parameters
+        ----------
+        - `thread_id` : The ID of the thread
+        - `channel_id` : The ID of the parent channel of the miror
+        
+        Returns
+        -------
+        - The ID of the thread of the family in this channel, or None if it
+        has not been created yet
+        --------------------------------------------------------------------"""
+
+        for link in await WhThread.get_family(thread_id):
+            if link.original_channel_id == channel_id:
+                return link.original_thread_id
+            if link.miror_channel_id == channel_id:
+                return link.miror_thread_id
+        return None
+
+
+class WhRouter:
+    """------------------------------------------------------------------------
+    In-memory routing table, loaded once and kept up to date by the backend
+    mutations, so that relaying a message doesn't require any SQL query.
+    It also indexes the wormhole admins, for the permission checks.
+    ------------------------------------------------------------------------"""
+
+    # Wormhole ID -> Wormhole
+    wormholes:dict[int, Wormhole] = {}
+
+    # Wormhole ID -> links of the wormhole
+    links:dict[int, list[WhLink]] = {}
+
+    # Channel ID -> IDs of the wormholes the channel is linked to
+    channels:dict[int, set[int]] = {}
+
+    # Source channel ID -> readable destination links
+    routes:dict[int, tuple[WhLink, ...]] = {}
+
+    # IDs of the channels having at least one route, checked before anything
+    # else for each message the bot sees
+    sources:frozenset[int] = frozenset()
+
+    # Guild ID -> IDs of the linked channels of the guild (built on demand)
+    guilds:dict[int, frozenset[int]] = {}
+
+    # Wormhole ID -> user ID -> admin of the wormhole
+    admins:dict[int, dict[int, WhAdmin]] = {}
+
+    @staticmethod
+    async def load() -> None:
+        """--------------------------------------------------------------------
+        Build the routing table from the database
+        --------------------------------------------------------------------"""
+
+        WhRouter.wormholes = {
+            wormhole.id: wormhole for wormhole in await Wormhole.all()
+        }
+        WhRouter.links = {
+            wormhole_id: [] for wormhole_id in WhRouter.wormholes
+        }
+        WhRouter.channels = {}
+        for link in await WhLink.all():
+            WhRouter.links.setdefault(link.wormhole_id, []).append(link)
+            WhRouter.channels.setdefault(link.channel_id, set())\
+                .add(link.wormhole_id)
+
+        WhRouter.routes = {}
+        WhRouter.guilds = {}
+        WhRouter._refresh(WhRouter.channels)
+
+        WhRouter.admins = {}
+        for admin in await WhAdmin.all():
+            WhRouter.admins.setdefault(admin.wormhole_id, {})[admin.user_id] \
+                = admin
+        Wormhole.accessible_cache.clear()
+
+        logs.info(
+            f"Wormhole routing table loaded: {len(WhRouter.wormholes)} "\
+            + f"wormholes, {len(WhRouter.routes)} source channels"
+        )
+
+    #==========================================================================
+    # Mutations
+    #==========================================================================
+
+    @staticmethod
+    def add_wormhole(wormhole:Wormhole) -> None:
+        """--------------------------------------------------------------------
+        Register a newly opened wormhole
+        
+        Parameters
+        ----------
+        - `wormhole` : The wormhole to register
+        --------------------------------------------------------------------"""
+
+        WhRouter.wormholes[wormhole.id] = wormhole
+        WhRouter.links.setdefault(wormhole.id, [])
+
+    @staticmethod
+    def add_link(link:WhLink) -> None:
+        """--------------------------------------------------------------------
+        Register a new link and update the affected routes
+        
+        Parameters
+        ----------
+        - `link` : The link to register
+        --------------------------------------------------------------------"""
+
+        links = WhRouter.links.setdefault(link.wormhole_id, [])
+        links.append(link)
+        WhRouter.channels.setdefault(link.channel_id, set())\
+            .add(link.wormhole_id)
+        WhRouter.guilds.clear()
+        WhRouter._refresh(l.channel_id for l in links)
+
+    @staticmethod
+    def remove_link(link:WhLink) -> None:
+        """--------------------------------------------------------------------
+        Unregister a link and update the affected routes
+        
+        Parameters
+        ----------
+        - `link` : The link to unregister
+        --------------------------------------------------------------------"""
+
+        links = WhRouter.links.get(link.wormhole_id, [])
+        links[:] = [l for l in links if l.channel_id != link.channel_id]
+        WhRouter.channels.get(link.channel_id, set())\
+            .discard(link.wormhole_id)
+        WhRouter.guilds.clear()
+        WhRouter._refresh(
+            [link.channel_id] + [l.channel_id for l in links]
+        )
+
+    @staticmethod
+    def add_admin(admin:WhAdmin) -> None:
+        """--------------------------------------------------------------------
+        Register a new wormhole admin
+        
+        Parameters
+        ----------
+        - `admin` : The admin to register
+        --------------------------------------------------------------------"""
+
+        WhRouter.admins.setdefault(admin.wormhole_id, {})[admin.user_id] \
+            = admin
+        Wormhole.accessible_cache.discard(admin.user_id)
+
+    @staticmethod
+    def remove_admin(wormhole_id:int, user_id:int) -> None:
+        """--------------------------------------------------------------------
+        Unregister a wormhole admin
+        
+        Parameters
+        ----------
+        - `wormhole_id` : The ID of the wormhole
+        - `user_id` : The ID of the user
+        --------------------------------------------------------------------"""
+
+        WhRouter.admins.get(wormhole_id, {}).pop(user_id, None)
+        Wormhole.accessible_cache.discard(user_id)
+
+    #==========================================================================
+    # Getters
+    #==========================================================================
+
+    @staticmethod
+    def get_destinations(channel_id:int) -> tuple[WhLink, ...]:
+        """--------------------------------------------------------------------
+        Return the links a message sent in a channel must be relayed to
+        
+        Parameters
+        ----------
+        - `channel_id` : The ID of the source channel
+        
+        Returns
+        -------
+        - The readable links of all the wormholes the channel can write in,
+        excluding the source channel itself
+        --------------------------------------------------------------------"""
+
+        return WhRouter.routes.get(channel_id, ())
+
+    @staticmethod
+    def get_thread_destinations(channel_id:int) -> tuple[WhLink, ...]:
+        """--------------------------------------------------------------------
+        Return the links a message sent in a thread must be relayed to
+        
+        Parameters
+        ----------
+        - `channel_id` : The ID of the parent channel of the thread
+        
+        Returns
+        -------
+        - The destinations of the parent channel, restricted to the wormholes
+        that sync threads
+        --------------------------------------------------------------------"""
+
+        destinations = []
+        for link in WhRouter.routes.get(channel_id, ()):
+            wormhole = WhRouter.wormholes.get(link.wormhole_id)
+            if wormhole is not None and wormhole.sync_threads:
+                destinations.append(link)
+        return tuple(destinations)
+
+    @staticmethod
+    def get_channels_in(guild:discord.Guild) -> frozenset[int]:
+        """--------------------------------------------------------------------
+        Return the linked channels of a guild. The index of a guild is built
+        the first time it is requested, and reset when links change.
+        
+        Parameters
+        ----------
+        - `guild` : The guild to check
+        
+        Returns
+        -------
+        - The IDs of the channels of the guild linked to a wormhole
+        --------------------------------------------------------------------"""
+
+        channels_id = WhRouter.guilds.get(guild.id)
+        if channels_id is None:
+            channels_id = frozenset(
+                channel.id for channel in guild.channels
+                if WhRouter.channels.get(channel.id)
+            )
+            WhRouter.guilds[guild.id] = channels_id
+
+        return channels_id
+
+    #==========================================================================
+    # Others
+    #==========================================================================
+
+    @staticmethod
+    def _refresh(channels_id) -> None:
+        """--------------------------------------------------------------------
+        Recompute the routes of some source channels
+        
+        Parameters
+        ----------
+        - `channels_id` : The IDs of the channels to recompute
+        --------------------------------------------------------------------"""
+
+        for channel_id in set(channels_id):
+            destinations = {}
+            for wormhole_id in WhRouter.channels.get(channel_id, ()):
+                links = WhRouter.links.get(wormhole_id, [])
+                if not any(
+                        l.channel_id == channel_id and l.can_write
+                        for l in links
+                    ):
+                    continue
+                for link in links:
+                    if link.can_read and link.channel_id != channel_id:
+                        destinations.setdefault(link.channel_id, link)
+
+            if destinations:
+                WhRouter.routes[channel_id] = tuple(destinations.values())
+            else:
+                WhRouter.routes.pop(channel_id, None)
+
+        WhRouter.sources = frozenset(WhRouter.routes)
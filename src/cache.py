@@ -0,0 +1,184 @@
+#==============================================================================
+# Requirements
+#==============================================================================
+
+# Standard libs ---------------------------------------------------------------
+
+import asyncio
+import collections
+import time
+from typing import Any, Hashable
+
+#==============================================================================
+# TTL set
+#==============================================================================
+
+class TTLSet:
+
+    def __init__(self, ttl:float):
+        """--------------------------------------------------------------------
+        Create a set whose items expire after a given duration. Expired items
+        are evicted by a single timer, rescheduled for the next expiration.
+
+        Parameters
+        ----------
+        - `ttl` : The lifetime of the items, in seconds
+        --------------------------------------------------------------------"""
+
+        self.ttl = ttl
+        self.expirations:collections.OrderedDict[Hashable, float] \
+            = collections.OrderedDict()
+        self.timer:asyncio.TimerHandle = None
+
+    def add(self, item:Hashable) -> None:
+        """--------------------------------------------------------------------
+        Add an item to the set, or renew its lifetime
+
+        Parameters
+        ----------
+        - `item` : The item to add
+        --------------------------------------------------------------------"""
+
+        self.expirations[item] = time.monotonic() + self.ttl
+        self.expirations.move_to_end(item)
+        if self.timer is None:
+            self._schedule()
+
+    def discard(self, item:Hashable) -> None:
+        """--------------------------------------------------------------------
+        Remove an item from the set if it is present
+
+        Parameters
+        ----------
+        - `item` : The item to remove
+        --------------------------------------------------------------------"""
+
+        self.expirations.pop(item, None)
+
+    def __contains__(self, item:Hashable) -> bool:
+        expiration = self.expirations.get(item)
+        return expiration is not None and expiration > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.expirations)
+
+    def _schedule(self) -> None:
+        """--------------------------------------------------------------------
+        Schedule the eviction timer for the oldest item
+        --------------------------------------------------------------------"""
+
+        if not self.expirations:
+            self.timer = None
+            return
+
+        # Items share the same TTL, so the first one expires first
+        expiration = next(iter(self.expirations.values()))
+        self.timer = asyncio.get_running_loop().call_later(
+            max(0, expiration - time.monotonic()),
+            self._evict
+        )
+
+    def _evict(self) -> None:
+        """--------------------------------------------------------------------
+        Remove the expired items, then reschedule the timer
+        --------------------------------------------------------------------"""
+
+        now = time.monotonic()
+        while self.expirations:
+            item, expiration = next(iter(self.expirations.items()))
+            if expiration > now:
+                break
+            del self.expirations[item]
+
+        self._schedule()
+
+#==============================================================================
+# LRU cache
+#==============================================================================
+
+class LRUCache:
+
+    def __init__(self, maxsize:int, ttl:float=None):
+        """--------------------------------------------------------------------
+        Create a bounded cache evicting the least recently used items, and
+        optionally the items older than a given duration.
+
+        Parameters
+        ----------
+        - `maxsize` : The maximum number of items kept
+        - `ttl` : The lifetime of the items, in seconds (None to keep them
+        until they are evicted)
+        --------------------------------------------------------------------"""
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items:collections.OrderedDict[Hashable, tuple[float, Any]] \
+            = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key:Hashable, default:Any=None) -> Any:
+        """--------------------------------------------------------------------
+        Return a cached item and mark it as recently used
+
+        Parameters
+        ----------
+        - `key` : The key of the item
+        - `default` : The value to return if the item is not cached
+
+        Returns
+        -------
+        - The cached item, or the default value
+        --------------------------------------------------------------------"""
+
+        item = self.items.get(key)
+        if item is None or (
+                self.ttl is not None and item[0] <= time.monotonic()
+            ):
+            if item is not None:
+                del self.items[key]
+            self.misses += 1
+            return default
+
+        self.items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, key:Hashable, value:Any) -> None:
+        """--------------------------------------------------------------------
+        Cache an item, evicting the least recently used one if needed
+
+        Parameters
+        ----------
+        - `key` : The key of the item
+        - `value` : The item to cache
+        --------------------------------------------------------------------"""
+
+        expiration = time.monotonic() + self.ttl if self.ttl else 0
+        self.items[key] = (expiration, value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def discard(self, key:Hashable) -> None:
+        """--------------------------------------------------------------------
+        Remove an item from the cache if it is present
+
+        Parameters
+        ----------
+        - `key` : The key of the item
+        --------------------------------------------------------------------"""
+
+        self.items.pop(key, None)
+
+    def clear(self) -> None:
+        self.items.clear()
+
+    def __contains__(self, key:Hashable) -> bool:
+        item = self.items.get(key)
+        return item is not None and (
+            self.ttl is None or item[0] > time.monotonic()
+        )
+
+    def __len__(self) -> int:
+        return len(self.items)
@@ -0,0 +1,321 @@
+#==============================================================================
+# Requirements
+#==============================================================================
+
+# Standard libs ---------------------------------------------------------------
+
+import hashlib
+import re
+import unicodedata
+from typing import Iterable, Optional
+
+#==============================================================================
+# Miror content codec
+#==============================================================================
+
+class WhMirorParts:
+
+    __slots__ = (
+        "content",
+        "reference_author",
+        "reference_url",
+        "reference_ids",
+        "reference_content",
+        "truncation_url"
+    )
+
+    def __init__(
+            self,
+            content:str,
+            reference_author:str=None,
+            reference_url:str=None,
+            reference_ids:tuple[Optional[int], int, int]=None,
+            reference_content:str=None,
+            truncation_url:str=None
+        ):
+        """--------------------------------------------------------------------
+        Decoded parts of a miror message
+
+        Parameters
+        ----------
+        - `content` : The content of the original message (truncated)
+        - `reference_author` : The display name of the referenced message
+        author, if any
+        - `reference_url` : The jump URL of the referenced message, if any
+        - `reference_ids` : The (guild, channel, message) IDs of the
+        referenced message, if any (the guild ID is None in DMs)
+        - `reference_content` : The cropped content of the referenced message
+        - `truncation_url` : The jump URL of the original message if its
+        content was truncated
+        --------------------------------------------------------------------"""
+
+        self.content = content
+        self.reference_author = reference_author
+        self.reference_url = reference_url
+        self.reference_ids = reference_ids
+        self.reference_content = reference_content
+        self.truncation_url = truncation_url
+
+class WhMirorCodec:
+
+    reference_prefix = "**╭** 💬 [**"
+    truncation_prefix = " [[...]](<"
+
+    # Maximum length of a message
+    max_length = 2000
+
+    # Maximum length of the referenced content in the reference preview
+    max_reference_length = 50
+
+    # Jump URL of a message, capturing its guild, channel and message IDs
+    _jump_url = re.compile(
+        r"https://(?:\w+\.)?discord(?:app)?\.com/channels/"
+        + r"(@me|\d+)/(\d+)/(\d+)"
+    )
+
+    # Reference preview header, matched at the start of the message only
+    _reference = re.compile(
+        re.escape(reference_prefix)
+        + r"(?P<author>[^\n]*?)\*\*\]\(<"
+        + r"(?P<url>" + _jump_url.pattern + r")"
+        + r">\) : (?P<content>[^\n]*)\n"
+    )
+
+    # Line breaks in the referenced content would break the header line
+    _line_breaks = re.compile(r"\s*\n\s*")
+
+    # Whitespace ignored when fingerprinting a message
+    _whitespace = re.compile(r"\s+")
+
+    #==========================================================================
+    # Encoding
+    #==========================================================================
+
+    @staticmethod
+    def encode_reference(author:str, jump_url:str, content:str) -> str:
+        """--------------------------------------------------------------------
+        Encode the reference preview header of a miror message
+
+        Parameters
+        ----------
+        - `author` : The display name of the referenced message author
+        - `jump_url` : The jump URL of the referenced message
+        - `content` : The content of the referenced message
+
+        Returns
+        -------
+        - The reference preview line, including its line break
+        --------------------------------------------------------------------"""
+
+        content = WhMirorCodec._line_breaks.sub(" ", content)
+        if len(content) > WhMirorCodec.max_reference_length:
+            content = content[:WhMirorCodec.max_reference_length - 3] + "..."
+
+        return WhMirorCodec.reference_prefix + author\
+            + "**](<" + jump_url + ">) : " + content + "\n"
+
+    @staticmethod
+    def encode_content(
+            content:str,
+            jump_url:str,
+            max_length:int=None
+        ) -> str:
+        """--------------------------------------------------------------------
+        Truncate the content of a message if it is too long to be mirored,
+        adding a link to the original message
+
+        Parameters
+        ----------
+        - `content` : The content of the original message
+        - `jump_url` : The jump URL of the original message
+        - `max_length` : The room left for the content in the miror message
+        (default to the maximum length of a message)
+
+        Returns
+        -------
+        - The content to put in the miror message
+        --------------------------------------------------------------------"""
+
+        if max_length is None:
+            max_length = WhMirorCodec.max_length
+        if len(content) <= max_length:
+            return content
+
+        suffix = WhMirorCodec.truncation_prefix + jump_url + ">)"
+        return content[:max(0, max_length - len(suffix))] + suffix
+
+    @staticmethod
+    def encode(
+            content:str,
+            jump_url:str,
+            reference:str="",
+            links:Iterable[str]=()
+        ) -> str:
+        """--------------------------------------------------------------------
+        Encode a whole miror message, within the maximum length of a message:
+        the content is truncated to leave room for the reference preview and
+        the links of the attachments too big to be uploaded
+
+        Parameters
+        ----------
+        - `content` : The content of the original message
+        - `jump_url` : The jump URL of the original message
+        - `reference` : The reference preview header, if any
+        - `links` : The links to add on their own lines after the content
+
+        Returns
+        -------
+        - The content of the miror message
+        --------------------------------------------------------------------"""
+
+        links = "".join("\n" + link for link in links)
+
+        # Links that don't fit are dropped, they stay reachable through the
+        # original message
+        shortest = min(
+            len(content),
+            len(WhMirorCodec.truncation_prefix) + len(jump_url) + 2
+        )
+        while links and len(reference) + shortest + len(links) \
+            > WhMirorCodec.max_length:
+            links = links[:links.rfind("\n")]
+
+        return reference + WhMirorCodec.encode_content(
+            content,
+            jump_url,
+            WhMirorCodec.max_length - len(reference) - len(links)
+        ) + links
+
+    #==========================================================================
+    # Decoding
+    #==========================================================================
+
+    @staticmethod
+    def decode(content:str) -> WhMirorParts:
+        """--------------------------------------------------------------------
+        Decode a miror message without splitting it, by matching the
+        reference header at its start and the truncation suffix at its end
+
+        Parameters
+        ----------
+        - `content` : The content of the miror message
+
+        Returns
+        -------
+        - The decoded parts of the miror message
+        --------------------------------------------------------------------"""
+
+        parts = WhMirorParts(content)
+        start = 0
+
+        # Reference preview header
+        header = WhMirorCodec._match_reference(content)
+        if header is not None:
+            guild, channel, message = header.group(3, 4, 5)
+            parts.reference_author = header["author"]
+            parts.reference_url = header["url"]
+            parts.reference_ids = (
+                None if guild == "@me" else int(guild),
+                int(channel),
+                int(message)
+            )
+            parts.reference_content = header["content"]
+            start = header.end()
+
+        # Truncation suffix
+        end = WhMirorCodec._find_truncation(content, start)
+        if end < len(content):
+            parts.truncation_url = content[
+                end + len(WhMirorCodec.truncation_prefix):-2
+            ]
+
+        parts.content = content[start:end]
+        return parts
+
+    @staticmethod
+    def decode_content(content:str) -> str:
+        """--------------------------------------------------------------------
+        Decode only the content of the original message from a miror
+        message. Mirors without reference preview nor truncation suffix (most
+        of them) are returned as is, without running any pattern.
+
+        Parameters
+        ----------
+        - `content` : The content of the miror message
+
+        Returns
+        -------
+        - The content of the original message (truncated)
+        --------------------------------------------------------------------"""
+
+        if not content.endswith(">)") \
+            and not content.startswith(WhMirorCodec.reference_prefix):
+            return content
+
+        header = WhMirorCodec._match_reference(content)
+        start = 0 if header is None else header.end()
+        end = WhMirorCodec._find_truncation(content, start)
+        if start == 0 and end == len(content):
+            return content
+        return content[start:end]
+
+    @staticmethod
+    def _match_reference(content:str) -> Optional[re.Match]:
+        # The prefix check is much cheaper than a failing match
+        if not content.startswith(WhMirorCodec.reference_prefix):
+            return None
+        return WhMirorCodec._reference.match(content)
+
+    @staticmethod
+    def _find_truncation(content:str, start:int) -> int:
+        # Index of the truncation suffix, only looked for at the end of the
+        # message (the length of the message if there is none)
+        end = len(content)
+        if not content.endswith(">)"):
+            return end
+        i = content.rfind(WhMirorCodec.truncation_prefix, start)
+        if i >= 0 and WhMirorCodec._jump_url.fullmatch(
+                content, i + len(WhMirorCodec.truncation_prefix), end - 2
+            ):
+            return i
+        return end
+
+    #==========================================================================
+    # Fingerprint
+    #==========================================================================
+
+    @staticmethod
+    def fingerprint(
+            author_id:int,
+            content:str,
+            attachments_id:Iterable[int]=()
+        ) -> int:
+        """--------------------------------------------------------------------
+        Compute a fixed-size fingerprint of a message, so that its versions
+        can be compared without keeping its whole content
+
+        Parameters
+        ----------
+        - `author_id` : The ID of the author of the original message
+        - `content` : The content of the original message
+        - `attachments_id` : The IDs of the attachments of the message
+
+        Returns
+        -------
+        - A signed 64 bits integer, that fits in an SQLite INTEGER
+        --------------------------------------------------------------------"""
+
+        content = WhMirorCodec._whitespace.sub(
+            " ",
+            unicodedata.normalize("NFC", content)
+        ).strip()
+
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(str(author_id).encode())
+        digest.update(b"\0")
+        digest.update(content.encode())
+        for attachment_id in attachments_id:
+            digest.update(b"\0")
+            digest.update(str(attachment_id).encode())
+
+        return int.from_bytes(digest.digest(), "big", signed=True)
@@ -0,0 +1,469 @@
+#==============================================================================
+# Requirements
+#==============================================================================
+
+# Standard libs ---------------------------------------------------------------
+
+import asyncio
+import concurrent.futures
+import functools
+import sqlite3
+from typing import Optional
+
+# Third party libs ------------------------------------------------------------
+
+from LRFutils import logs
+
+# Project modules -------------------------------------------------------------
+
+import allay
+from .log import WhLog
+
+#==============================================================================
+# Database
+#==============================================================================
+
+class WhDatabase:
+
+    # Dedicated thread running all the wormhole queries, so that a slow disk
+    # or a locked database never blocks the event loop
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=1,
+        thread_name_prefix="wormhole-db"
+    )
+
+    # Path of the database file (default to the main database of allay)
+    path:str = None
+
+    # Connection owned by the database thread, never used by another thread
+    connection:sqlite3.Connection = None
+
+    # Number of prepared statements kept by the connection
+    cached_statements = 256
+
+    # Time to wait for a lock held by another connection, in seconds
+    timeout = 30
+
+    # Whether mutations made without a batch are delayed and grouped
+    write_behind = False
+
+    # Delay before the delayed mutations are written, in seconds
+    flush_interval = 0.5
+
+    # Mutations waiting to be written in write-behind mode
+    deferred:"WhBatch" = None
+    flushing:asyncio.TimerHandle = None
+
+    # Held while delayed mutations are written, so that flushes don't overlap
+    writing:asyncio.Lock = None
+
+    # Number of flushes failed in a row, to space out the next attempts
+    failures = 0
+
+    # Maximum delay between two attempts to write failed mutations, in seconds
+    max_retry_delay = 60.0
+
+    # (table, column, definition) of the columns to add to older databases
+    migrations = [
+        ("wormhole_mirors", "fingerprint", "BIGINT"),
+    ]
+
+    @staticmethod
+    async def setup() -> None:
+        """--------------------------------------------------------------------
+        Open the connection of the database thread, configured for
+        concurrent reads and writes
+        --------------------------------------------------------------------"""
+
+        # Share the database file of allay, through a connection of our own
+        if WhDatabase.path is None:
+            rows = allay.Database.query(
+                "SELECT file FROM pragma_database_list WHERE name='main'"
+            )
+            WhDatabase.path = rows[0]['file']
+
+        await asyncio.get_running_loop().run_in_executor(
+            WhDatabase.executor,
+            WhDatabase._connect
+        )
+        logs.info(
+            f"Wormhole database connected to {WhDatabase.path} (WAL mode)"
+        )
+
+        # Columns added after the creation of the tables
+        for table, column, definition in WhDatabase.migrations:
+            columns = await WhDatabase.query(f"PRAGMA table_info({table})")
+            if columns and column not in (c['name'] for c in columns):
+                await WhDatabase.query(
+                    f"ALTER TABLE {table} ADD COLUMN {column} {definition}"
+                )
+                logs.info(f"Wormhole database: added {table}.{column}")
+
+    @staticmethod
+    async def close() -> None:
+        """--------------------------------------------------------------------
+        Close the connection of the database thread
+        --------------------------------------------------------------------"""
+
+        await asyncio.get_running_loop().run_in_executor(
+            WhDatabase.executor,
+            WhDatabase._disconnect
+        )
+
+    @staticmethod
+    async def query(query:str, args:tuple=()):
+        """--------------------------------------------------------------------
+        Run a query on the dedicated database thread, once the mutations
+        delayed by the write-behind mode are written, so that the query sees
+        them and a delayed mutation can't be written after it.
+        Queries should be constant strings with `?` placeholders, so that
+        the connection can reuse their prepared statements.
+
+        Parameters
+        ----------
+        - `query` : The SQL query
+        - `args` : The arguments of the query
+
+        Returns
+        -------
+        - The rows as dicts if the query returns rows, the ID of the last
+        inserted row otherwise
+        --------------------------------------------------------------------"""
+
+        # A failed flush is logged and retried later, the query still runs
+        if WhDatabase.deferred or (
+                WhDatabase.writing is not None and WhDatabase.writing.locked()
+            ):
+            try:
+                await WhDatabase.flush()
+            except Exception:
+                pass
+
+        return await asyncio.get_running_loop().run_in_executor(
+            WhDatabase.executor,
+            functools.partial(WhDatabase._run, query, args)
+        )
+
+    # Database thread ---------------------------------------------------------
+
+    @staticmethod
+    def _connect() -> None:
+        if WhDatabase.connection is not None:
+            return
+
+        connection = sqlite3.connect(
+            WhDatabase.path,
+            timeout=WhDatabase.timeout,
+            cached_statements=WhDatabase.cached_statements
+        )
+        connection.row_factory = sqlite3.Row
+
+        # WAL mode is persistent, it only needs to be enabled once
+        connection.execute("PRAGMA journal_mode=WAL")
+        WhDatabase.connection = connection
+
+    @staticmethod
+    def _disconnect() -> None:
+        connection, WhDatabase.connection = WhDatabase.connection, None
+        if connection is not None:
+            connection.close()
+
+    @staticmethod
+    def _run(query:str, args:tuple):
+        if WhDatabase.connection is None:
+            WhDatabase._connect()
+
+        connection = WhDatabase.connection
+        try:
+            cursor = connection.execute(query, args)
+            if cursor.description is not None:
+                return [dict(row) for row in cursor.fetchall()]
+            connection.commit()
+        except sqlite3.Error:
+            # Release the write lock of the implicit transaction, the
+            # database file is shared with the connection of allay
+            connection.rollback()
+            raise
+        return cursor.lastrowid
+
+    @staticmethod
+    def _run_all(statements:list[tuple[str, tuple]]) -> None:
+        if WhDatabase.connection is None:
+            WhDatabase._connect()
+
+        connection = WhDatabase.connection
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for query, args in statements:
+                connection.execute(query, args)
+            connection.commit()
+        except sqlite3.Error:
+            connection.rollback()
+            raise
+
+    #==========================================================================
+    # Mutations
+    #==========================================================================
+
+    @staticmethod
+    async def insert(
+            table:str,
+            columns:tuple[str, ...],
+            row:tuple,
+            batch:"WhBatch"=None
+        ) -> None:
+        """--------------------------------------------------------------------
+        Insert a row, now or as part of a batch
+
+        Parameters
+        ----------
+        - `table` : The table to insert the row in
+        - `columns` : The columns of the row
+        - `row` : The values of the row
+        - `batch` : The batch to add the insertion to (default to the
+        write-behind batch if enabled, otherwise the row is inserted now)
+        --------------------------------------------------------------------"""
+
+        if batch is None:
+            batch = WhDatabase.defer()
+        if batch is not None:
+            batch.insert(table, columns, row)
+            return
+
+        await WhDatabase.query(
+            f"INSERT INTO {table} ({', '.join(columns)}) "\
+                + f"VALUES ({','.join('?' * len(columns))})",
+            tuple(row)
+        )
+
+    @staticmethod
+    async def delete(
+            table:str,
+            columns:tuple[str, ...],
+            key:tuple,
+            batch:"WhBatch"=None
+        ) -> None:
+        """--------------------------------------------------------------------
+        Delete the rows matching a key, now or as part of a batch
+
+        Parameters
+        ----------
+        - `table` : The table to delete the rows from
+        - `columns` : The columns of the key
+        - `key` : The values of the key
+        - `batch` : The batch to add the deletion to (default to the
+        write-behind batch if enabled, otherwise the rows are deleted now)
+        --------------------------------------------------------------------"""
+
+        if batch is None:
+            batch = WhDatabase.defer()
+        if batch is not None:
+            batch.delete(table, columns, key)
+            return
+
+        await WhDatabase.query(
+            f"DELETE FROM {table} WHERE "\
+                + " AND ".join(f"{column}=?" for column in columns),
+            tuple(key)
+        )
+
+    #==========================================================================
+    # Write-behind
+    #==========================================================================
+
+    @staticmethod
+    def defer() -> Optional["WhBatch"]:
+        """--------------------------------------------------------------------
+        Return the write-behind batch and schedule its flush, if write-behind
+        mode is enabled
+
+        Returns
+        -------
+        - The write-behind batch, or None if write-behind mode is disabled
+        --------------------------------------------------------------------"""
+
+        if not WhDatabase.write_behind:
+            return None
+
+        if WhDatabase.deferred is None:
+            WhDatabase.deferred = WhBatch()
+        WhDatabase._schedule(WhDatabase.flush_interval)
+        return WhDatabase.deferred
+
+    @staticmethod
+    def retry(batch:"WhBatch", error:Exception) -> None:
+        """--------------------------------------------------------------------
+        Keep the mutations of a batch that could not be written, to write them
+        later with the delayed mutations (whatever the write-behind mode), as
+        the routing table already reflects them
+
+        Parameters
+        ----------
+        - `batch` : The batch that failed
+        - `error` : The error raised when writing it
+        --------------------------------------------------------------------"""
+
+        if WhDatabase.deferred is not None:
+            batch.runs += WhDatabase.deferred.runs
+        WhDatabase.deferred = batch
+
+        WhDatabase.failures += 1
+        delay = min(
+            WhDatabase.flush_interval * 2 ** WhDatabase.failures,
+            WhDatabase.max_retry_delay
+        )
+        WhDatabase._schedule(delay)
+        WhLog.error(
+            "database.flush", "Failed to write %s mutations (%r), "\
+                + "retry in %ss",
+            len(batch), error, delay
+        )
+
+    @staticmethod
+    def _schedule(delay:float) -> None:
+        if WhDatabase.flushing is None:
+            WhDatabase.flushing = asyncio.get_running_loop().call_later(
+                delay,
+                lambda: asyncio.ensure_future(WhDatabase._flush_later())
+            )
+
+    @staticmethod
+    async def _flush_later() -> None:
+        WhDatabase.flushing = None
+        # A failed flush is logged and scheduled again by itself
+        try:
+            await WhDatabase.flush()
+        except Exception:
+            pass
+
+    @staticmethod
+    async def flush() -> None:
+        """--------------------------------------------------------------------
+        Write the mutations delayed by the write-behind mode, once those of
+        a flush in progress are written. If it fails, the mutations are kept
+        and written again later.
+        --------------------------------------------------------------------"""
+
+        if WhDatabase.flushing is not None:
+            WhDatabase.flushing.cancel()
+            WhDatabase.flushing = None
+
+        if WhDatabase.writing is None:
+            WhDatabase.writing = asyncio.Lock()
+
+        # Wait for a flush in progress, then write what was delayed since
+        async with WhDatabase.writing:
+            batch, WhDatabase.deferred = WhDatabase.deferred, None
+            if batch is None:
+                return
+            try:
+                await batch.flush()
+            except Exception as e:
+                WhDatabase.retry(batch, e)
+                raise
+            WhDatabase.failures = 0
+
+#==============================================================================
+# Batch
+#==============================================================================
+
+class WhBatch:
+
+    # Maximum number of values bound to a single statement
+    max_variables = 999
+
+    def __init__(self):
+        """--------------------------------------------------------------------
+        Create an empty batch of mutations. Mutations are written in
+        submission order, consecutive mutations of a same kind being written
+        with a single multi-row statement, so that they are committed together
+        instead of once per row.
+
+        Example
+        -------
+        ```
+        async with WhBatch() as batch:
+            for channel in category.channels:
+                await WhLink.add(wormhole, channel, batch=batch)
+        ```
+        --------------------------------------------------------------------"""
+
+        # Runs of consecutive mutations of a same kind, in submission order:
+        # (kind, table, columns, rows to insert or keys of rows to delete)
+        self.runs:list[tuple[str, str, tuple[str, ...], list[tuple]]] = []
+
+    def insert(self, table:str, columns:tuple[str, ...], row:tuple) -> None:
+        self._add("INSERT", table, columns, row)
+
+    def delete(self, table:str, columns:tuple[str, ...], key:tuple) -> None:
+        self._add("DELETE", table, columns, key)
+
+    def _add(
+            self,
+            kind:str,
+            table:str,
+            columns:tuple[str, ...],
+            values:tuple
+        ) -> None:
+
+        columns = tuple(columns)
+        if self.runs and self.runs[-1][:3] == (kind, table, columns):
+            self.runs[-1][3].append(tuple(values))
+        else:
+            self.runs.append((kind, table, columns, [tuple(values)]))
+
+    def __len__(self) -> int:
+        return sum(len(values) for *_, values in self.runs)
+
+    async def flush(self) -> None:
+        """--------------------------------------------------------------------
+        Write the mutations of the batch, in submission order and in a single
+        transaction. If it fails, nothing is written and the mutations are
+        kept in the batch.
+        --------------------------------------------------------------------"""
+
+        runs, self.runs = self.runs, []
+
+        statements = []
+        for kind, table, columns, values in runs:
+            tuple_ = f"({','.join('?' * len(columns))})"
+            for chunk in WhBatch._chunks(values, len(columns)):
+                tuples = ','.join([tuple_] * len(chunk))
+                if kind == "DELETE":
+                    query = f"DELETE FROM {table} "\
+                        + f"WHERE ({', '.join(columns)}) IN (VALUES {tuples})"
+                else:
+                    query = f"INSERT INTO {table} ({', '.join(columns)}) "\
+                        + f"VALUES {tuples}"
+                statements.append(
+                    (query, tuple(value for row in chunk for value in row))
+                )
+        if not statements:
+            return
+
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                WhDatabase.executor,
+                functools.partial(WhDatabase._run_all, statements)
+            )
+        except Exception:
+            # Keep them before the mutations added meanwhile
+            self.runs = runs + self.runs
+            raise
+
+    @staticmethod
+    def _chunks(rows:list[tuple], width:int):
+        size = max(1, WhBatch.max_variables // width)
+        for i in range(0, len(rows), size):
+            yield rows[i:i+size]
+
+    async def __aenter__(self) -> "WhBatch":
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        # The mutations added before an error are written too, as the
+        # routing table already reflects them
+        try:
+            await self.flush()
+        except Exception as e:
+            WhDatabase.retry(self, e)
@@ -5,21 +5,29 @@
 # Standard libs ---------------------------------------------------------------
 
 import difflib
+import functools
+import io
+import time
 from typing import Optional, Union
 import asyncio
 
 # Third party libs ------------------------------------------------------------
 
 import discord
-from discord.ext import commands
-from LRFutils import logs
+from discord.ext import commands, tasks
 
 # Project modules -------------------------------------------------------------
 
 import allay
 from .wormhole_selector import WormholeSelectorView
-from .backend import Wormhole, WhLink, WhAdmin
+from .backend import Wormhole, WhLink, WhAdmin, WhMiror, WhRouter, WhThread
 from . import discord_utils
+from .relay import WhFanOut, WhSendQueue
+from .cache import TTLSet
+from .attachments import WhAttachments
+from .database import WhDatabase
+from .log import WhLog
+from .metrics import WhMetrics
 
 #==============================================================================
 # Plugin
@@ -29,6 +37,21 @@ class WhCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_load(self):
+        discord_utils.WhWebhook.client = self.bot
+        await WhDatabase.setup()
+        await WhRouter.load()
+        await WhMetrics.serve()
+        self.prune_mirors.start()
+
+    async def cog_unload(self):
+        self.prune_mirors.cancel()
+        try:
+            await WhDatabase.flush()
+        finally:
+            await WhDatabase.close()
+            await WhMetrics.close()
+
     wormhole = discord.app_commands.Group(
         name="wormhole",
         description="Connect several points between space and time",
@@ -36,6 +59,15 @@ class WhCog(commands.Cog):
         guild_only=True
     )
 
+    # Forget the old mirors, when loaded then periodically
+    @tasks.loop(hours=6)
+    async def prune_mirors(self):
+        await WhMiror.prune()
+        WhLog.info(
+            "miror.prune", "Forgot the mirors older than %s days",
+            WhMiror.retention.days
+        )
+
     #==========================================================================
     # Utils
     #==========================================================================
@@ -60,17 +92,13 @@ class WhCog(commands.Cog):
         - The list of possible choices
         --------------------------------------------------------------------"""
 
-        possible_choices = []
-        for wormhole in Wormhole.get_accessible_by(interaction.user):
-            if current.lower() in str(wormhole).lower():
-                possible_choices.append(
-                    discord.app_commands.Choice(
-                        name=str(wormhole),
-                        value=wormhole.id
-                    )
-                )
-
-        return possible_choices
+        return [
+            discord.app_commands.Choice(name=str(wormhole), value=wormhole.id)
+            for wormhole in await Wormhole.search_accessible_by(
+                interaction.user,
+                current
+            )
+        ]
 
     async def action_autocomplete(self, interaction, current:str):
         """--------------------------------------------------------------------
@@ -134,52 +162,83 @@ class WhCog(commands.Cog):
     
     # List wormholes as embeds ------------------------------------------------
 
-    async def wormhole_list_as_embeds(
+    async def wormhole_list_as_embed_pages(
             self,
-            wormholes:list[Wormhole]
-        ) -> list[discord.Embed]:
+            wormholes:list[Wormhole],
+            page_size:int=10
+        ):
         """--------------------------------------------------------------------
-        List wormholes as embeds
+        List wormholes as embeds, yielded by pages as soon as they are ready
 
         Parameters
         ----------
         - `wormholes` : The list of wormholes to list
+        - `page_size` : The number of embeds per page (a message can't have
+        more than 10 embeds)
 
-        Returns
-        -------
-        - The list of embeds
+        Yields
+        ------
+        - The lists of embeds of each page
         --------------------------------------------------------------------"""
 
-        list_embeds = []
-        for wormhole in wormholes:
-            admins = WhAdmin.get_from(wormhole)
-            admin_names = ", ".join(
-                [self.bot.get_user(admin.user_id).mention for admin in admins]
+        # Load the admins of all the wormholes at once
+        admins = await WhAdmin.get_from_all(wormholes)
+
+        for i in range(0, len(wormholes), page_size):
+            page = wormholes[i:i+page_size]
+
+            # Resolve the admins of the page, fetching the uncached ones
+            # concurrently
+            users_id = {
+                admin.user_id
+                for wormhole in page
+                for admin in admins.get(wormhole.id, [])
+            }
+            users = {}
+            missing = []
+            for user_id in users_id:
+                user = self.bot.get_user(user_id)
+                if user is None:
+                    missing.append(user_id)
+                else:
+                    users[user_id] = user
+            fetched = await asyncio.gather(
+                *(self.bot.fetch_user(user_id) for user_id in missing),
+                return_exceptions=True
             )
-            channels = ", ".join(
-                [
-                    self.bot.get_channel(link.channel_id).mention
-                    + " 👀" if link.can_read else ""
-                    + " ✍️" if link.can_write else ""
+            for user_id, user in zip(missing, fetched):
+                if isinstance(user, discord.User):
+                    users[user_id] = user
+
+            embeds = []
+            for wormhole in page:
+                admin_names = ", ".join(
+                    users[admin.user_id].mention
+                    if admin.user_id in users else f"<@{admin.user_id}>"
+                    for admin in admins.get(wormhole.id, [])
+                )
+                channels = ", ".join(
+                    f"<#{link.channel_id}>"
+                    + (" 👀" if link.can_read else "")
+                    + (" ✍️" if link.can_write else "")
                     for link in wormhole.links
-                ]
-            )
+                )
 
-            # Create embed
-            embed = discord.Embed(
-                title=wormhole.name,
-                description=f"Channels: {channels}\nAdmins: {admin_names}"
-            )
-            if wormhole.sync_threads:
-                sync_threads = "✅ Sync threads"
-            else:
-                sync_threads = "❌ Doesn't sync threads"
-            embed.set_footer(text=f"Id: {wormhole.id} - {sync_threads}")
+                # Create embed
+                embed = discord.Embed(
+                    title=wormhole.name,
+                    description=f"Channels: {channels}\nAdmins: {admin_names}"
+                )
+                if wormhole.sync_threads:
+                    sync_threads = "✅ Sync threads"
+                else:
+                    sync_threads = "❌ Doesn't sync threads"
+                embed.set_footer(text=f"Id: {wormhole.id} - {sync_threads}")
 
-            # Add embed to list
-            list_embeds.append(embed)
-        
-        return list_embeds
+                # Add embed to page
+                embeds.append(embed)
+
+            yield embeds
 
     #==========================================================================
     # Commands
@@ -206,7 +265,7 @@ class WhCog(commands.Cog):
         - `sync_threads` : If the threads should be synced
         --------------------------------------------------------------------"""
 
-        if len(Wormhole.get_accessible_by(interaction.user)) >= 5:
+        if len(await Wormhole.get_accessible_by(interaction.user)) >= 5:
             await interaction.response.send_message(
                 allay.I18N.tr(
                     interaction,
@@ -215,8 +274,8 @@ class WhCog(commands.Cog):
             )
             return
 
-        wormhole_id = Wormhole.open(name, sync_threads)
-        WhAdmin.add(wormhole_id, interaction.user.id)
+        wormhole_id = await Wormhole.open(name, sync_threads)
+        await WhAdmin.add(wormhole_id, interaction.user.id)
 
         await interaction.response.send_message(
             allay.I18N.tr(
@@ -259,7 +318,7 @@ class WhCog(commands.Cog):
             return
 
         if which == "I'm admin of":
-            wormholes = Wormhole.get_accessible_by(interaction.user)
+            wormholes = await Wormhole.get_accessible_by(interaction.user)
             if len(wormholes) == 0:
                 await interaction.response.send_message(
                     allay.I18N.tr(
@@ -269,11 +328,9 @@ class WhCog(commands.Cog):
                 return
             else:
                 message = allay.I18N.tr(interaction, "wormhole.list.user")
-                embeds = await self.wormhole_list_as_embeds(wormholes)
-                
 
         elif which == "are linked to this channel":
-            wormholes = Wormhole.get_linked_to(interaction.channel)
+            wormholes = await Wormhole.get_linked_to(interaction.channel)
             if len(wormholes) == 0:
                 await interaction.response.send_message(
                     allay.I18N.tr(
@@ -284,12 +341,9 @@ class WhCog(commands.Cog):
                 return
             else:
                 message = allay.I18N.tr(interaction, "wormhole.list.channel")
-                embeds = await self.wormhole_list_as_embeds(wormholes)
 
         elif which == "are linked somewhere in this guild":
-            wormholes = []
-            for channel in interaction.guild.channels:
-                wormholes += Wormhole.get_linked_to(channel)
+            wormholes = Wormhole.get_linked_in(interaction.guild)
             if len(wormholes) == 0:
                 await interaction.response.send_message(
                     allay.I18N.tr(
@@ -300,11 +354,12 @@ class WhCog(commands.Cog):
                 return
             else:
                 message = allay.I18N.tr(interaction, "wormhole.list.guild")
-                embeds = await self.wormhole_list_as_embeds(
-                    Wormhole.set(wormholes)
-                )
 
-        await interaction.response.send_message(message, embeds=embeds)
+        async for embeds in self.wormhole_list_as_embed_pages(wormholes):
+            if not interaction.response.is_done():
+                await interaction.response.send_message(message, embeds=embeds)
+            else:
+                await interaction.followup.send(embeds=embeds)
 
     @discord.ext.commands.command(
         name="wormholes",
@@ -318,14 +373,33 @@ class WhCog(commands.Cog):
         ----------
         - `ctx` : The discord context
         --------------------------------------------------------------------"""
-        embeds = await self.wormhole_list_as_embeds(
-            Wormhole.get_all_wormholes()
-        )
-        for i in range(0, len(embeds), 10):
-            await ctx.send(
-                "All wormholes:" if i==0 else "",
-                embeds=embeds[i:i+10]
+        first = True
+        async for embeds in self.wormhole_list_as_embed_pages(
+                await Wormhole.all()
+            ):
+            await ctx.send("All wormholes:" if first else "", embeds=embeds)
+            first = False
+
+    @discord.ext.commands.command(
+        name="wormhole-metrics",
+        description="Dump the relay metrics"
+    )
+    @discord.ext.commands.is_owner()
+    async def wh_metrics(self, ctx:discord.ext.commands.Context) -> None:
+        """--------------------------------------------------------------------
+        Secret command to dump the relay metrics, in the Prometheus text
+        format (for when the scrape endpoint is disabled)
+
+        Parameters
+        ----------
+        - `ctx` : The discord context
+        --------------------------------------------------------------------"""
+        await ctx.send(
+            file=discord.File(
+                io.BytesIO(WhMetrics.render().encode()),
+                filename="wormhole_metrics.txt"
             )
+        )
 
     # Link --------------------------------------------------------------------
 
@@ -359,15 +433,15 @@ class WhCog(commands.Cog):
         if channel is None:
             channel = interaction.channel
 
-        wormhole = Wormhole.get_by_id(wormhole)
+        wormhole = await Wormhole.get_by_id(wormhole)
 
         # Apply routine for a given wormhole ID ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
         # Check if the source user is admin of the wormhole
-        if not Wormhole.is_in(
-                wormhole,
-                Wormhole.get_accessible_by(interaction.user)
-            ):
+        if wormhole is None or wormhole.id not in [
+                wh.id
+                for wh in await Wormhole.get_accessible_by(interaction.user)
+            ]:
             await interaction.response.send_message(
                 allay.I18N.tr(
                     interaction,
@@ -403,7 +477,7 @@ class WhCog(commands.Cog):
                 return
         
             # Create the link
-            WhLink.add(wormhole, channel.id, read, write)  
+            await WhLink.add(wormhole, channel.id, read, write)  
 
             # Confirm the addition
             await interaction.response.send_message(
@@ -431,7 +505,9 @@ class WhCog(commands.Cog):
                 return
             
             # Remove the link
-            WhLink.remove(wormhole, channel.id)
+            for link in wormhole.links:
+                if link.channel_id == channel.id:
+                    await link.remove()
 
             # Confirm the removal
             await interaction.response.send_message(
@@ -468,7 +544,7 @@ class WhCog(commands.Cog):
         - `wormhole` : The wormhole ID
         --------------------------------------------------------------------"""
 
-        wormhole = Wormhole.get_by_id(wormhole)
+        wormhole = await Wormhole.get_by_id(wormhole)
 
         # Run checks ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -494,7 +570,8 @@ class WhCog(commands.Cog):
 
         # Check if the source user is admin of the wormhole
         if wormhole.id not in [
-                wh.id for wh in Wormhole.get_accessible_by(interaction.user)
+                wh.id
+                for wh in await Wormhole.get_accessible_by(interaction.user)
             ]:
             await interaction.response.send_message(
                 allay.I18N.tr(
@@ -510,7 +587,7 @@ class WhCog(commands.Cog):
 
             # Check if the target user is already admin of the wormhole
             if user.id in [
-                    admin.user_id for admin in WhAdmin.get_from(wormhole)
+                    admin.user_id for admin in await WhAdmin.get_from(wormhole)
                 ]:
                 await interaction.response.send_message(
                     allay.I18N.tr(
@@ -523,7 +600,7 @@ class WhCog(commands.Cog):
                 return
         
             # Check if the target user already have 5 wormholes
-            if len(Wormhole.get_accessible_by(user)) >= 5:
+            if len(await Wormhole.get_accessible_by(user)) >= 5:
                 await interaction.response.send_message(
                     allay.I18N.tr(
                         interaction,
@@ -534,7 +611,7 @@ class WhCog(commands.Cog):
                 return
             
             # Applye
-            WhAdmin.add(wormhole, user)
+            await WhAdmin.add(wormhole, user)
             await interaction.response.send_message(
                 allay.I18N.tr(
                     interaction,
@@ -550,7 +627,7 @@ class WhCog(commands.Cog):
 
             # Check if the target user is admin of the wormhole
             if user.id not in [
-                    admin.user_id for admin in WhAdmin.get_from(wormhole)
+                    admin.user_id for admin in await WhAdmin.get_from(wormhole)
                 ]:
                 await interaction.response.send_message(
                     allay.I18N.tr(
@@ -562,7 +639,7 @@ class WhCog(commands.Cog):
                 return
 
             # Apply
-            WhAdmin.remove(wormhole, user)
+            await WhAdmin.remove(wormhole, user)
             await interaction.response.send_message(
                 allay.I18N.tr(
                     interaction,
@@ -578,6 +655,123 @@ class WhCog(commands.Cog):
 
     # On message --------------------------------------------------------------
 
+    # Get the destinations of a channel or thread ----------------------------
+
+    def get_route(
+            self,
+            channel:discord.abc.Messageable
+        ) -> tuple[int, tuple[WhLink, ...]]:
+        """--------------------------------------------------------------------
+        Return the linked channel a channel or a thread belongs to, and the
+        links its messages must be relayed to
+
+        Parameters
+        ----------
+        - `channel` : The channel or the thread
+
+        Returns
+        -------
+        - The ID of the channel, or of the parent of the thread
+        - The destinations of the messages
+        --------------------------------------------------------------------"""
+
+        if isinstance(channel, discord.Thread):
+            return channel.parent_id, \
+                WhRouter.get_thread_destinations(channel.parent_id)
+        return channel.id, WhRouter.get_destinations(channel.id)
+
+    def get_parent_id(self, channel_id:int) -> int:
+        """--------------------------------------------------------------------
+        Return the ID of the parent of a thread, or the ID itself if it is not
+        a known thread
+
+        Parameters
+        ----------
+        - `channel_id` : The ID of the channel or the thread
+        --------------------------------------------------------------------"""
+
+        channel = self.bot.get_channel(channel_id)
+        if isinstance(channel, discord.Thread):
+            return channel.parent_id
+        return channel_id
+
+    # Get the miror of a thread -----------------------------------------------
+
+    async def get_miror_thread(
+            self,
+            thread:discord.Thread,
+            channel:discord.abc.GuildChannel
+        ) -> Optional[discord.abc.Messageable]:
+        """--------------------------------------------------------------------
+        Return the miror of a thread in a linked channel, creating it the
+        first time it is needed. Threads started from a message are started
+        from the miror of this message.
+
+        Parameters
+        ----------
+        - `thread` : The original thread
+        - `channel` : The linked channel
+
+        Returns
+        -------
+        - The miror thread, or None if it doesn't exist and can't be created
+        here (forum posts need their first message)
+        --------------------------------------------------------------------"""
+
+        miror_id = await WhThread.get_in(thread.id, channel.id)
+        if miror_id is not None:
+            return channel.get_thread(miror_id) \
+                or self.bot.get_partial_messageable(
+                    miror_id,
+                    guild_id=channel.guild.id,
+                    type=discord.ChannelType.public_thread
+                )
+
+        if not isinstance(channel, discord.TextChannel):
+            return None
+
+        # A thread started from a message has the ID of this message
+        original = await WhMiror.get_original(thread.id)
+        if original is None:
+            original = (thread.id, thread.parent_id)
+        if original[1] == channel.id:
+            starter_id = original[0]
+        else:
+            starter_id = await WhMiror.get_in(original[0], channel.id)
+
+        miror = None
+        try:
+            if starter_id is not None:
+                try:
+                    miror = await channel.get_partial_message(starter_id)\
+                        .create_thread(
+                            name=thread.name,
+                            auto_archive_duration=thread.auto_archive_duration
+                        )
+                except discord.HTTPException:
+                    WhLog.debug(
+                        "thread.create", "Starter miror unavailable",
+                        thread=thread.id,
+                        channel=channel.id
+                    )
+            if miror is None:
+                miror = await channel.create_thread(
+                    name=thread.name,
+                    auto_archive_duration=thread.auto_archive_duration,
+                    type=discord.ChannelType.public_thread
+                )
+        except discord.HTTPException as e:
+            WhLog.warning(
+                "thread.create", "Can't create thread in %s (%s): %s",
+                channel.name, channel.id, e
+            )
+            return None
+
+        await WhThread.add(thread, miror.id, channel.id)
+        return miror
+
+    # On message --------------------------------------------------------------
+
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         """--------------------------------------------------------------------
@@ -588,74 +782,242 @@ class WhCog(commands.Cog):
         - `message` : The message
         --------------------------------------------------------------------"""
 
-        print("\n----------\n")
-        logs.info(f"New message detected!")
+        # Most messages are in channels without any wormhole
+        if message.channel.id not in WhRouter.sources:
+            if not isinstance(message.channel, discord.Thread) \
+                or message.channel.parent_id not in WhRouter.sources:
+                return
+
+        # Never relay the bot's own messages (like the missing permissions
+        # warning) nor webhook messages, which include the mirors
+        if message.webhook_id is not None or message.author == self.bot.user:
+            return
 
-        logs.info(f"Getting wormholes...")
+        # Messages in a thread are relayed to the mirors of the thread
+        thread = None
+        if isinstance(message.channel, discord.Thread):
+            thread = message.channel
+            if thread.type == discord.ChannelType.private_thread:
+                return
 
         # Check if the message is in a wormhole channel
-        wormholes = Wormhole.get_linked_to(
-            message.channel,
-            filter_can_write=True
-        )
-        if len(wormholes) == 0:
-            logs.info(f"Message is not in a wormhole channel ⛔")
+        _, destinations = self.get_route(message.channel)
+        if len(destinations) == 0:
+            WhLog.debug(
+                "relay.ignored", "No destination",
+                channel=message.channel.id
+            )
             return
-        
-        logs.info("Wormhole found ✅")
-        logs.info("Getting associated webhook...")
 
-        webhook = await discord_utils.WhWebhook.get_in(message.channel)
+        WhLog.info(
+            "relay.message", "Relaying message %s", message.id,
+            channel=message.channel.id,
+            destinations=len(destinations)
+        )
+        started = time.perf_counter()
 
-        # Check if the message is from the wormhole webhook
-        if message.author.id == webhook.id:
-            logs.info(f"Message is from the wormhole webhook ⛔")
-            return
-        
-        logs.info(f"Message come from a human ✅")
+        # Keep the message at hand for the replies to come
+        discord_utils.WhMessage.cache.put(message.id, message)
         
-        # Send the message to all linked channels
-        for wormhole in wormholes:
-            for link in wormhole.links:
+        # Get the destination channels
+        destination_channels = []
+        for link in destinations:
+                
+            # If the channel is no longer accessible (or was deleted)
+            # Then remove the link
+            destination_channel = self.bot.get_channel(link.channel_id)
+            if destination_channel is None:
+                await link.remove()
+                WhMetrics.links_dropped.inc()
+                continue
 
-                # Remove channels that can't read the new messages
-                if not link.can_read:
-                    continue
+            destination_channels.append(destination_channel)
 
-                # Remove the channel where the message was sent
-                if link.channel_id == message.channel.id:
-                    continue
-                
-                # If the channel is no longer accessible (or was deleted)
-                # Then remove the link
-                destination_channel = self.bot.get_channel(link.channel_id)
-                if destination_channel is None:
-                    link.remove()
-                    continue
-
-                # Send the miror message
-                webhook = await discord_utils.WhWebhook.get_in(
-                    destination_channel
-                )
-                content = await discord_utils.WhMessage\
-                .compose_miror_content(
-                    message,
-                    channel=destination_channel
+        # Fingerprint the message once for all its mirors
+        fingerprint = discord_utils.WhMessage.fingerprint(message)
+
+        # Download the attachments once for all the destinations
+        downloading = asyncio.ensure_future(WhAttachments.download(message))
+
+        # Prepare the parts of the miror message shared by all destinations
+        preparing = asyncio.ensure_future(
+            discord_utils.WhMessage.prepare_miror(message)
+        )
+
+        # Send the miror message
+        async def send_miror(destination_channel):
+            for attempt in range(2):
+
+                # Find or create the miror of the thread, if any
+                target, extra = destination_channel, {}
+                if thread is not None:
+                    target = await self.get_miror_thread(
+                        thread,
+                        destination_channel
+                    )
+                    if target is not None:
+                        extra["thread"] = target
+                    elif isinstance(
+                            destination_channel,
+                            discord.ForumChannel
+                        ):
+                        # Forum posts are created with their first message
+                        target = destination_channel
+                        extra["thread_name"] = thread.name
+                    else:
+                        return
+
+                draft = await asyncio.shield(preparing)
+                attachments = await asyncio.shield(downloading)
+                content = await draft.render(target, attachments.links)
+                try:
+                    with WhMetrics.send_seconds.time():
+                        miror = await discord_utils.WhWebhook.send(
+                            destination_channel,
+                            content,
+                            username=message.author.display_name,
+                            avatar_url=message.author.display_avatar.url,
+                            allowed_mentions=discord.AllowedMentions.none(),
+                            files=attachments.files,
+                            embeds=message.embeds,
+                            wait=True,
+                            **extra)
+                    break
+                except discord.HTTPException as e:
+                    # Unknown channel: the miror thread is gone (e.g. deleted
+                    # while the bot was offline), forget it and create it again
+                    if e.code != 10003 or "thread" not in extra or attempt > 0:
+                        raise
+                    WhLog.info(
+                        "thread.lost", "Miror thread %s is gone, recreating",
+                        target.id,
+                        thread=thread.id
+                    )
+                    await WhThread.remove(target.id)
+
+            if miror is not None and "thread_name" in extra:
+                await WhThread.add(
+                    thread,
+                    miror.channel.id,
+                    destination_channel.id
                 )
-                await webhook.send(
-                    content,
-                    username=message.author.display_name,
-                    avatar_url=message.author.avatar.url,
-                    allowed_mentions=discord.AllowedMentions.none(),
-                    files=[
-                        await attachment.to_file()
-                        for attachment in message.attachments
-                    ],
-                    embeds=message.embeds)
+
+            # Remember the miror to find it again without scanning history
+            if miror is not None:
+                await WhMiror.add(message, miror, fingerprint)
+                discord_utils.WhMessage.cache.put(miror.id, miror)
+
+        # Queue the message for all linked channels at once, keeping the
+        # order of the messages in each destination
+        sendings = {
+            channel.id: WhSendQueue.submit(
+                channel,
+                functools.partial(send_miror, channel)
+            )
+            for channel in destination_channels
+        }
+        try:
+            errors = await WhFanOut.run(
+                destination_channels,
+                lambda channel: sendings[channel.id]
+            )
+            WhMetrics.relayed.inc()
+            WhMetrics.fanout.observe(len(destination_channels))
+            if errors:
+                WhMetrics.send_errors.inc(amount=len(errors))
+        finally:
+            WhMetrics.relay_seconds.observe(time.perf_counter() - started)
+            preparing.cancel()
+            if not downloading.done():
+                downloading.cancel()
+            elif not downloading.cancelled() \
+                and downloading.exception() is None:
+                downloading.result().close()
+
+    # Delete mirors -----------------------------------------------------------
+
+    async def delete_mirors(
+            self,
+            channel_id:int,
+            messages_id:set[int]
+        ) -> None:
+        """--------------------------------------------------------------------
+        Delete, in all linked channels, the mirors (and originals) of messages
+        deleted in a channel. Messages are grouped by destination channel so
+        that each destination is cleaned with as few calls as possible.
+
+        Parameters
+        ----------
+        - `channel_id` : The ID of the channel where the messages were deleted
+        - `messages_id` : The IDs of the deleted messages
+        --------------------------------------------------------------------"""
+
+        # Check if the messages are in a wormhole channel
+        channel = self.bot.get_channel(channel_id) \
+            or discord.Object(channel_id)
+        _, destinations = self.get_route(channel)
+        if len(destinations) == 0:
+            return
+
+        started = time.perf_counter()
+
+        # Group the messages to delete by destination channel (or thread)
+        readable = {link.channel_id: link for link in destinations}
+        to_delete = {}
+        originals_id = set()
+        with WhMetrics.miror_lookup_seconds.time("family"):
+            family = await WhMiror.get_family(messages_id)
+        for miror in family:
+            originals_id.add(miror.original_id)
+            for message_id, destination_id in (
+                    (miror.original_id, miror.original_channel_id),
+                    (miror.miror_id, miror.miror_channel_id)
+                ):
+                if self.get_parent_id(destination_id) in readable \
+                    and message_id not in messages_id:
+                    to_delete.setdefault(destination_id, set()).add(message_id)
+
+        if not originals_id:
+            return
+
+        # Forget the mirors first, so that the deletions below are not
+        # propagated once again
+        await WhMiror.remove_all(originals_id)
+        for messages in to_delete.values():
+            for message_id in messages:
+                WhCog.supression_cache.add(message_id)
+                discord_utils.WhMessage.cache.discard(message_id)
+
+        destination_channels = []
+        for destination_id in to_delete:
+
+            # If the channel is no longer accessible (or was deleted)
+            # Then remove the link
+            destination_channel = self.bot.get_channel(destination_id)
+            if destination_channel is None:
+                if destination_id in readable:
+                    await readable[destination_id].remove()
+                    WhMetrics.links_dropped.inc()
+                continue
+
+            destination_channels.append(destination_channel)
+
+        async def delete_in(destination_channel):
+            await discord_utils.WhMessage.delete_all(
+                destination_channel,
+                to_delete[destination_channel.id]
+            )
+
+        errors = await WhFanOut.run(destination_channels, delete_in)
+        if errors:
+            WhMetrics.send_errors.inc(amount=len(errors))
+        WhMetrics.deleted.inc(amount=len(originals_id))
+        WhMetrics.delete_seconds.observe(time.perf_counter() - started)
 
     # On message deleted ------------------------------------------------------
 
-    supression_cache = []
+    # IDs of the messages being deleted by the wormhole
+    supression_cache = TTLSet(5)
 
     @commands.Cog.listener()
     async def on_message_delete(self, message: discord.Message):
@@ -668,54 +1030,209 @@ class WhCog(commands.Cog):
         - `message` : The message
         --------------------------------------------------------------------"""
                     
-        print("Message deleted\n", message.content)
-        
         # Check if the message is in a wormhole channel
-        wormholes = Wormhole.get_linked_to(
-            message.channel,
-            filter_can_write=True
-        )
-        if len(wormholes) == 0:
+        _, destinations = self.get_route(message.channel)
+        if len(destinations) == 0:
             return
-        
+
         # If the message is already in supression process, then ignore it
-        message_hash = await discord_utils.WhMessage.get_hash(message) 
-        if message_hash in WhCog.supression_cache:
-            logs.info("Message is already in supression process ⛔")
+        if message.id in WhCog.supression_cache:
+            WhLog.debug(
+                "delete.ignored", "Already being deleted",
+                message=message.id
+            )
             return
+
+        WhLog.debug("delete.message", "Deleting mirors", message=message.id)
         
         # Add the message to the supression cache
-        WhCog.supression_cache.append(message_hash)
-        
-        for wormhole in wormholes:
-            for link in wormhole.links:
-                
-                # Ignore channels that can't see the wormhole activity
-                if not link.can_read:
-                    continue
-                
-                # If the channel is no longer accessible (or was deleted)
-                # Then remove the link
-                destination_channel = self.bot.get_channel(link.channel_id)
-                if destination_channel is None:
-                    link.remove()
-                    continue
-
-                # Ignore the channel where the message was deleted
-                if destination_channel.id == message.channel.id:
-                    continue
-                
-                # Get the miror message
-                miror_message = await discord_utils.WhMessage\
-                .get_miror_in(message, channel=destination_channel)
-                
-                # If the miror message is not accessible, then ignore it
-                if miror_message is None:
-                    continue
-                
-                # Delete the miror message
-                await miror_message.delete()
+        WhCog.supression_cache.add(message.id)
+        discord_utils.WhMessage.cache.discard(message.id)
         
-        await asyncio.sleep(5)
-        WhCog.supression_cache.remove(message_hash)
+        await self.delete_mirors(message.channel.id, {message.id})
+
+    # On messages bulk deleted ------------------------------------------------
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(
+            self,
+            payload:discord.RawBulkMessageDeleteEvent
+        ):
+        """--------------------------------------------------------------------
+        When messages are purged, delete their miror messages in all linked
+        channels
+
+        Parameters
+        ----------
+        - `payload` : The bulk deletion event
+        --------------------------------------------------------------------"""
+
+        messages_id = {
+            message_id for message_id in payload.message_ids
+            if message_id not in WhCog.supression_cache
+        }
+        if messages_id:
+            await self.delete_mirors(payload.channel_id, messages_id)
+
+    # On message edited -------------------------------------------------------
+
+    # Delay during which the edits of a message are merged, in seconds
+    edit_delay = 1.0
+
+    # Original message ID -> latest version waiting or being propagated
+    pending_edits:dict[int, discord.Message] = {}
+
+    @commands.Cog.listener()
+    async def on_message_edit(
+            self,
+            before:discord.Message,
+            after:discord.Message
+        ):
+        """--------------------------------------------------------------------
+        When a message is edited, edit its miror messages in all linked
+        channels. Rapid edits are merged, so that only the latest version is
+        propagated.
+
+        Parameters
+        ----------
+        - `before` : The message before the edit
+        - `after` : The message after the edit
+        --------------------------------------------------------------------"""
+
+        # Check if the message is in a wormhole channel
+        _, destinations = self.get_route(after.channel)
+        if len(destinations) == 0:
+            return
+
+        # Embeds being resolved or pinning don't change the miror
+        fingerprint = discord_utils.WhMessage.fingerprint(after)
+        if fingerprint == discord_utils.WhMessage.fingerprint(before):
+            return
+
+        # Mirors are edited by the wormhole itself
+        if after.webhook_id is not None:
+            return
+
+        # An edit of this message is already waiting or being propagated,
+        # just replace it
+        if after.id in WhCog.pending_edits:
+            WhCog.pending_edits[after.id] = after
+            return
+
+        WhCog.pending_edits[after.id] = after
+        try:
+            while True:
+                await asyncio.sleep(WhCog.edit_delay)
+                message = WhCog.pending_edits[after.id]
+                await self.edit_mirors(message)
+
+                # Edited again meanwhile, propagate the newest version after
+                # this one, so that it is sent last
+                if WhCog.pending_edits[after.id] is message:
+                    break
+        finally:
+            WhCog.pending_edits.pop(after.id, None)
+
+    # Edit mirors -------------------------------------------------------------
+
+    async def edit_mirors(self, message:discord.Message) -> None:
+        """--------------------------------------------------------------------
+        Edit the mirors of an original message in all linked channels
+
+        Parameters
+        ----------
+        - `message` : The latest version of the original message
+        --------------------------------------------------------------------"""
+
+        discord_utils.WhMessage.cache.put(message.id, message)
+
+        mirors = {
+            miror.miror_channel_id: miror
+            for miror in await WhMiror.get_from(message.id)
+        }
+        if not mirors:
+            return
+
+        # The mirors already show this version (e.g. an edit reverted before
+        # the previous one was propagated)
+        fingerprint = discord_utils.WhMessage.fingerprint(message)
+        if all(
+                miror.fingerprint == fingerprint
+                for miror in mirors.values()
+            ):
+            return
+        await WhMiror.set_fingerprint(message.id, fingerprint)
+
+        _, destinations = self.get_route(message.channel)
+        readable = {link.channel_id: link for link in destinations}
+        destination_channels = []
+        for destination_id in mirors:
+            if self.get_parent_id(destination_id) not in readable:
+                continue
+
+            # If the channel is no longer accessible (or was deleted)
+            # Then remove the link
+            destination_channel = self.bot.get_channel(destination_id)
+            if destination_channel is None:
+                if destination_id in readable:
+                    await readable[destination_id].remove()
+                    WhMetrics.links_dropped.inc()
+                continue
+
+            destination_channels.append(destination_channel)
+
+        draft = await discord_utils.WhMessage.prepare_miror(message)
+
+        # The uploaded attachments are kept, only the links are rewritten
+        links = [
+            attachment.url for attachment in message.attachments
+            if attachment.size > WhAttachments.max_size
+        ]
+
+        async def edit_miror(destination_channel):
+            miror_id = mirors[destination_channel.id].miror_id
+            content = await draft.render(destination_channel, links)
+            miror = await discord_utils.WhWebhook.edit(
+                destination_channel,
+                miror_id,
+                content=content,
+                embeds=message.embeds,
+                allowed_mentions=discord.AllowedMentions.none()
+            )
+            if miror is not None:
+                discord_utils.WhMessage.cache.put(miror.id, miror)
+            else:
+                discord_utils.WhMessage.cache.discard(miror_id)
+
+        # Queue the edits after the pending sends of each destination
+        # (threads share the queue of their parent)
+        editings = {
+            channel.id: WhSendQueue.submit(
+                discord.Object(self.get_parent_id(channel.id)),
+                functools.partial(edit_miror, channel)
+            )
+            for channel in destination_channels
+        }
+        errors = await WhFanOut.run(
+            destination_channels,
+            lambda channel: editings[channel.id]
+        )
+        if errors:
+            WhMetrics.send_errors.inc(amount=len(errors))
+
+    # On thread deleted -------------------------------------------------------
+
+    @commands.Cog.listener()
+    async def on_raw_thread_delete(self, payload:discord.RawThreadDeleteEvent):
+        """--------------------------------------------------------------------
+        When a thread is deleted, forget its links with its mirors
+
+        Parameters
+        ----------
+        - `payload` : The thread deletion event
+        --------------------------------------------------------------------"""
 
+        # Whatever the routes of its parent (e.g. a miror thread in a read
+        # only channel), a known thread must be forgotten
+        if await WhThread.get_family(payload.thread_id):
+            await WhThread.remove(payload.thread_id)
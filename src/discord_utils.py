@@ -2,6 +2,12 @@ import discord
 from typing import Optional
 from LRFutils import logs
 import allay
+from .backend import WhMiror
+from .database import WhDatabase
+from .cache import LRUCache, TTLSet
+from .codec import WhMirorCodec
+from .log import WhLog
+from .metrics import WhMetrics
 
 #==============================================================================
 # Webhook
@@ -9,6 +15,17 @@ import allay
 
 class WhWebhook:
 
+    __slots__ = ("id", "token", "channel_id")
+
+    # Channel ID -> ready to use webhook
+    cache:dict[int, discord.Webhook] = {}
+
+    # Client used to initialise the cached webhooks
+    client:discord.Client = None
+
+    # IDs of the channels recently warned about the missing permissions
+    warned = TTLSet(3600)
+
     def __init__(
             self,
             id:int|discord.Webhook,
@@ -30,6 +47,7 @@ class WhWebhook:
         """--------------------------------------------------------------------
         Get the wormhole webhook in a specific channel.
         If the webhook does not exist, create it.
+        Threads share the webhook of their parent channel.
         
         Parameters
         ----------
@@ -39,28 +57,47 @@ class WhWebhook:
         -------
         - The wormhole webhook.
         --------------------------------------------------------------------"""
+
+        if isinstance(channel, discord.Thread):
+            channel = channel.parent
+            if channel is None:
+                return None
+
+        webhook = WhWebhook.cache.get(channel.id)
+        if webhook is not None:
+            WhMetrics.webhook_cache.inc("hit")
+            return webhook
+        WhMetrics.webhook_cache.inc("miss")
         
-        webhook = allay.Database.query(
-            f"SELECT * FROM wormhole_webhooks WHERE channel_id={channel.id}"
+        webhook = await WhDatabase.query(
+            "SELECT * FROM wormhole_webhooks WHERE channel_id=?",
+            (channel.id,)
         )
 
         if len(webhook) > 1:
             logs.error(
                 f"Channel {channel.name} ({channel.id}) "\
                 + "have more than one wormhole webhook: "\
-                + ', '.join(w['id'] for w in webhook)
+                + ', '.join(str(w['id']) for w in webhook)
             )
 
         if webhook:
-            for w in await channel.guild.webhooks():
-                if w.id == webhook[0]['id']:
-                    webhook = w
-                    break
+            webhook = discord.Webhook.partial(
+                webhook[0]['id'],
+                webhook[0]['token'],
+                client=WhWebhook.client
+            )
         else:
             
             if not channel.permissions_for(channel.guild.me).manage_webhooks:
+
+                # Warn once, the lookup is retried for each relayed message
+                if channel.id in WhWebhook.warned:
+                    return None
+                WhWebhook.warned.add(channel.id)
+
                 try:
-                    channel.send(
+                    await channel.send(
                         allay.I18N.tr(
                             channel,
                             "wormhole.webhook.missing-permissions"
@@ -75,19 +112,133 @@ class WhWebhook:
                 return None
 
             webhook = await channel.create_webhook(name="Allay Wormhole")
-            allay.Database.query(
-                f"INSERT INTO wormhole_webhooks "\
-                + "(id, token, channel_id) VALUES (?,?,?)",
+            await WhDatabase.insert(
+                "wormhole_webhooks",
+                ("id", "token", "channel_id"),
                 (webhook.id, webhook.token, channel.id)
             )
 
+        WhWebhook.cache[channel.id] = webhook
         return webhook
 
+    # Forget a webhook that is no longer usable -------------------------------
+
     @staticmethod
-    def all():
+    async def invalidate(channel) -> None:
+        """--------------------------------------------------------------------
+        Forget the wormhole webhook of a channel, so that a new one is created
+        the next time it is needed.
+        
+        Parameters
+        ----------
+        - `channel` : The channel where the webhook was.
+        --------------------------------------------------------------------"""
+
+        if isinstance(channel, discord.Thread):
+            channel = discord.Object(channel.parent_id)
+
+        logs.warning(
+            f"Wormhole > Webhook of channel {channel.id} is no longer valid"
+        )
+        WhWebhook.cache.pop(channel.id, None)
+        await WhDatabase.delete(
+            "wormhole_webhooks",
+            ("channel_id",),
+            (channel.id,)
+        )
+
+    # Send a message through the webhook of a channel -------------------------
+
+    @staticmethod
+    async def send(channel, *args, **kwargs) -> Optional[discord.Message]:
+        """--------------------------------------------------------------------
+        Send a message through the wormhole webhook of a channel.
+        If the webhook was deleted or its token revoked, it is invalidated and
+        the message is sent again through a new one.
+        
+        Parameters
+        ----------
+        - `channel` : The channel where the message should be sent. Messages
+        sent to a thread go through the webhook of its parent.
+        - `*args`, `**kwargs` : The arguments of `discord.Webhook.send`.
+        `files` may be a function returning new files, called for each
+        attempt since sent files are consumed. Otherwise, a message with
+        files is not sent again.
+            
+        Returns
+        -------
+        - The sent message if `wait=True` was given, None otherwise.
+        --------------------------------------------------------------------"""
+
+        if isinstance(channel, discord.Thread):
+            kwargs.setdefault("thread", channel)
+
+        files = kwargs.pop("files", None)
+        retry = callable(files) \
+            or (not files and kwargs.get("file") is None)
+
+        for attempt in range(2):
+            webhook = await WhWebhook.get_in(channel)
+            if webhook is None:
+                return None
+            if files is not None:
+                kwargs["files"] = files() if callable(files) else files
+            try:
+                return await webhook.send(*args, **kwargs)
+            except discord.HTTPException as e:
+                # Unknown webhook or revoked token (and not unknown thread)
+                if not (e.status == 401 or e.code == 10015) \
+                    or attempt > 0 or not retry:
+                    raise
+                await WhWebhook.invalidate(channel)
+
+    # Edit a message sent through the webhook of a channel --------------------
+
+    @staticmethod
+    async def edit(
+            channel,
+            message_id:int,
+            **kwargs
+        ) -> Optional[discord.Message]:
+        """--------------------------------------------------------------------
+        Edit a message sent through the wormhole webhook of a channel.
+        Messages sent by a deleted webhook can't be edited by a new one, so
+        the edit is not retried.
+
+        Parameters
+        ----------
+        - `channel` : The channel or thread of the message.
+        - `message_id` : The ID of the message to edit.
+        - `**kwargs` : The arguments of `discord.Webhook.edit_message`.
+
+        Returns
+        -------
+        - The edited message, or None if it can't be edited anymore.
+        --------------------------------------------------------------------"""
+
+        if isinstance(channel, discord.Thread):
+            kwargs.setdefault("thread", channel)
+
+        webhook = await WhWebhook.get_in(channel)
+        if webhook is None:
+            return None
+        try:
+            return await webhook.edit_message(message_id, **kwargs)
+        except discord.HTTPException as e:
+            # Unknown webhook or revoked token
+            if e.status == 401 or e.code == 10015:
+                await WhWebhook.invalidate(channel)
+                return None
+            # Unknown message
+            if e.status == 404:
+                return None
+            raise
+
+    @staticmethod
+    async def all():
         return [
             WhWebhook(**data)
-            for data in allay.Database.query(
+            for data in await WhDatabase.query(
                 f"SELECT * FROM wormhole_webhooks"
             )
         ]
@@ -98,28 +249,43 @@ class WhWebhook:
 
 class WhMessage():
 
-    reference_prefix = "**╭** 💬 [**"
-    trunc_prefix = "[...](<https://discord.com/channels/"
+    reference_prefix = WhMirorCodec.reference_prefix
+    trunc_prefix = WhMirorCodec.truncation_prefix
     max_content_size = 1500
 
+    # Recently seen messages, to avoid fetching them again
+    cache = LRUCache(maxsize=2000, ttl=3600)
+
+    # Fetch a message, using the cache first ----------------------------------
+
+    async def fetch(
+            channel:discord.abc.GuildChannel,
+            message_id:int
+        ) -> discord.Message:
+
+        message = WhMessage.cache.get(message_id)
+        if message is None:
+            message = await channel.fetch_message(message_id)
+            WhMessage.cache.put(message_id, message)
+        return message
+
     async def get_hash(message):
         
         # Check if it is an original message -> keep the content
         webhook = await WhWebhook.get_in(message.channel)
         if message.author.id != webhook.id:
             content = message.content
-            logs.info(f"Get original message: {content}")
         # Or a miror message -> extract the content
         else:
             content = WhMessage.extract_content_from_miror(
                 message.content
             )
-            logs.info(f"Get miror message: {content}")
         return content
 
     async def get_reference(message):
         # Check if it is an original message -> keep the content
-        if message.author.id != await WhWebhook.get_in(message.channel):
+        webhook = await WhWebhook.get_in(message.channel)
+        if message.author.id != webhook.id:
             return message.reference
         # Or a miror message -> extract the content
         else:
@@ -128,114 +294,120 @@ class WhMessage():
             )
 
 
+    # Get all the mirors of a message -----------------------------------------
+
+    async def get_mirors(message:discord.Message) -> dict[int, int]:
+
+        # A single query finds the original of the message (if it is itself
+        # a miror) and all its mirors
+        with WhMetrics.miror_lookup_seconds.time("family"):
+            family = await WhMiror.get_family([message.id])
+
+        if family:
+            original_id = family[0].original_id
+            original_channel_id = family[0].original_channel_id
+        else:
+            original_id, original_channel_id = message.id, message.channel.id
+
+        # Channel ID -> ID of the message of the family in this channel
+        mirors = {miror.miror_channel_id: miror.miror_id for miror in family}
+        mirors[original_channel_id] = original_id
+        return mirors
+
     # Get miror message in a specific channel ---------------------------------
 
     async def get_miror_in(
             message:discord.Message,
             channel:discord.abc.GuildChannel
-        ) -> Optional[discord.Message]:
+        ) -> Optional[discord.PartialMessage]:
+
+        miror_id = (await WhMessage.get_mirors(message)).get(channel.id)
+        if miror_id is None:
+            WhLog.debug(
+                "miror.lookup", "Miror not found",
+                message=message.id,
+                channel=channel.id
+            )
+            return None
 
-        date = message.created_at
-
-        logs.info(f"Searching for miror message in {channel.name}...")
-
-        async for msg in channel.history(
-                limit=5,
-                after=date,
-                oldest_first=True
-            ):
-            if await WhMessage.equal(message, msg):
-                logs.info(f"Found miror message ✅")
-                return msg
-        logs.info(
-            "Not found after the original message date, "\
-            + "may be it is before..."
-        )
-        async for msg in channel.history(
-                limit=5,
-                before=date,
-                oldest_first=False
-            ):
-            if await WhMessage.equal(message, msg):
-                logs.info(f"Found miror message ✅")
-                return msg
-        return None
+        return WhMessage.cache.get(miror_id) \
+            or channel.get_partial_message(miror_id)
     
-    # Compare two wormhole messages -------------------------------------------
+    # Delete several messages in a specific channel ---------------------------
+
+    async def delete_all(
+            channel:discord.abc.GuildChannel,
+            messages_id:set[int]
+        ) -> None:
+
+        messages = [discord.Object(id) for id in sorted(messages_id)]
+
+        # Bulk delete when allowed (fails on messages older than 14 days)
+        if channel.permissions_for(channel.guild.me).manage_messages:
+            try:
+                for i in range(0, len(messages), 100):
+                    await channel.delete_messages(messages[i:i+100])
+                return
+            except discord.HTTPException:
+                WhLog.debug(
+                    "delete.bulk", "Bulk deletion failed, deleting one by one",
+                    channel=channel.id
+                )
 
-    async def equal(msg1:discord.Message, msg2:discord.Message) -> bool:
-        c1 = await WhMessage.get_hash(msg1) 
-        c2 = await WhMessage.get_hash(msg2)
-        logs.info(f"Comparing\n{c1.__repr__()}\nand\n{c2.__repr__()}")
-        return c1 == c2
-    
-    # Compose the reference preview -------------------------------------------
-    
-    async def compose_reference_preview(
-            message:discord.Message, 
-            channel:discord.abc.GuildChannel=None
-        ) -> str:
+        # Otherwise, the webhook can still delete its own messages
+        webhook = await WhWebhook.get_in(channel)
+        if webhook is None:
+            return
+        thread = channel if isinstance(channel, discord.Thread) \
+            else discord.utils.MISSING
+        for message in messages:
+            try:
+                await webhook.delete_message(message.id, thread=thread)
+            except discord.HTTPException:
+                pass
+
+    # Fingerprint of an original message --------------------------------------
+
+    def fingerprint(message:discord.Message) -> int:
+        return WhMirorCodec.fingerprint(
+            message.author.id,
+            message.content,
+            (attachment.id for attachment in message.attachments)
+        )
+
+    # Get the referenced message ----------------------------------------------
+
+    async def get_reference_message(
+            message:discord.Message
+        ) -> Optional[discord.Message]:
 
         reference = await WhMessage.get_reference(message)
+        if reference is None:
+            return None
 
-        # Include the reference preview
-        if reference is not None:
-            
-            logs.info("Reference available ✅")   
-            
-            # Get original reference
-            reference_message = await message.channel.fetch_message(
+        # Get original reference
+        try:
+            return await WhMessage.fetch(
+                message.channel,
                 reference.message_id
             )
+        except discord.HTTPException:
+            WhLog.debug(
+                "miror.reference", "Original reference not found",
+                message=message.id,
+                reference=reference.message_id
+            )
+            return None
 
-            # If the reference is is not accessible, then ignore it
-            # otherwise, try to get the miror reference
-            if reference_message is not None:
-
-                logs.info("Original reference found ✅")
-                logs.info("Getting the miror one...")   
-                
-                # Get miror reference
-                miror_reference_message = await WhMessage.get_miror_in(
-                    reference_message, channel
-                )
-
-                # If the miror reference is not accessible,
-                # then use the original reference
-                if miror_reference_message is None:
-                    logs.info("Miror reference not found ❌") 
-                    miror_reference_message = reference_message
-                else:
-                    logs.info("Miror reference found ✅") 
-
-                # Crop the content
-                # (if the refence also have a reference or if it is too long)
-                reference_content = miror_reference_message.content
-                if len(reference_content) > 50:
-                    reference_content = reference_content[:47] + "..."
-
-                logs.info("Composing reference preview...")
-
-                # Add the croped reference to the miror message
-                reference_preview = (
-                    WhMessage.reference_prefix
-                    + reference_message.author.display_name
-                    + "**](<"
-                    + miror_reference_message.jump_url
-                    + ">) : "
-                    + await WhMessage.get_hash(miror_reference_message)
-                    + "\n"
-                )
-
-                logs.info(f"Reference preview: {reference_preview}")
+    # Compose the reference preview -------------------------------------------
+    
+    async def compose_reference_preview(
+            message:discord.Message, 
+            channel:discord.abc.GuildChannel=None
+        ) -> str:
 
-                return reference_preview
-            
-            logs.info("Original reference not found ❌") 
-        else:
-            logs.info("No reference")
-        
-        return ""
+        draft = await WhMessage.prepare_miror(message)
+        return await draft.render_reference_preview(channel)
     
     # Truncate the content ----------------------------------------------------
 
@@ -243,57 +415,142 @@ class WhMessage():
             message:discord.Message,
             channel:discord.abc.GuildChannel=None
         ) -> str:
-        if len(message.content) > 2000:
-            logs.info("Truncating message")
-            trunc = f" [[...]](<{message.jump_url}>)"
-            return message.content[:2000-len(trunc)] + trunc
-        else:
-            logs.info("No truncation")
+        if len(message.content) > WhMirorCodec.max_length:
+            WhLog.debug(
+                "miror.truncate", "Truncating message",
+                message=message.id,
+                length=len(message.content)
+            )
+            return WhMirorCodec.encode_content(
+                message.content,
+                message.jump_url
+            )
         return message.content
     
+    # Prepare a miror message -------------------------------------------------
+
+    async def prepare_miror(message:discord.Message) -> "WhMirorDraft":
+        draft = WhMirorDraft()
+
+        # Truncated when rendered, to leave room for the reference preview
+        draft.content = message.content
+        draft.jump_url = message.jump_url
+
+        # If the reference is is not accessible, then ignore it
+        reference_message = await WhMessage.get_reference_message(message)
+        if reference_message is not None:
+
+            # The content is cropped when the preview is rendered
+            # (if the refence also have a reference or if it is too long)
+            draft.reference_message = reference_message
+            draft.reference_author = reference_message.author.display_name
+            draft.reference_content = await WhMessage.get_hash(
+                reference_message
+            )
+
+            # Resolved once for all the destinations
+            draft.reference_mirors = await WhMessage.get_mirors(
+                reference_message
+            )
+
+        return draft
+
     # Compose a miror message -------------------------------------------------
     
     async def compose_miror_content(
             message:discord.Message,
             channel:discord.abc.GuildChannel=None
         ) -> str:
-        logs.info("Start composing miror message...")
 
-        ref = await WhMessage.compose_reference_preview(message, channel)
-        content = await WhMessage.truncated_content(message, channel)
-        return ref + content
+        draft = await WhMessage.prepare_miror(message)
+        return await draft.render(channel)
 
     @staticmethod
     def extract_content_from_miror(content):
-        # Remove reference preview
-        if content.startswith(WhMessage.reference_prefix):
-            content = "\n".join(content.split("\n")[1:])
-        # Remove truncation info
-        if content.endswith(">)"):
-            splitted_content = content.split(WhMessage.trunc_prefix)
-            if len(splitted_content) > 1:
-                content = WhMessage.trunc_prefix.join(
-                    splitted_content[:-1]
-                )
-        return content
+        # Remove reference preview and truncation info
+        return WhMirorCodec.decode_content(content)
     
     @staticmethod
     def extract_reference_from_miror(
             content:str
         ) -> Optional[discord.MessageReference]:
 
-        if content.startswith(WhMessage.reference_prefix):
-            ref = content.split("\n")[0]
-            ref = ref.split("](<")[1]
-            ref = ref.split(">)")[0]
-            ref_id = ref.split("/")[-1]
+        reference_ids = WhMirorCodec.decode(content).reference_ids
+        if reference_ids is None:
+            return None
 
-            reference = discord.abc.Messageable.fetch_message(ref_id)
+        guild_id, channel_id, message_id = reference_ids
+        return discord.MessageReference(
+            message_id=message_id,
+            channel_id=channel_id,
+            guild_id=guild_id
+        )
 
-            return discord.MessageReference(
-                message_id=reference.id,
-                channel_id=reference.channel.id,
-                guild_id=reference.guild.id if reference.guild else None)
-    
-        return None
 
+
+#==============================================================================
+# Miror draft
+#==============================================================================
+
+class WhMirorDraft():
+
+    def __init__(self):
+        """--------------------------------------------------------------------
+        Parts of a miror message that don't depend on the destination channel,
+        computed once per original message.
+        --------------------------------------------------------------------"""
+
+        self.content = ""
+        self.jump_url = ""
+        self.reference_message:Optional[discord.Message] = None
+        self.reference_author = ""
+        self.reference_content = ""
+
+        # Channel ID -> ID of the referenced message or of its miror there
+        self.reference_mirors:dict[int, int] = {}
+
+    # Compose the reference preview -------------------------------------------
+
+    async def render_reference_preview(
+            self,
+            channel:discord.abc.GuildChannel
+        ) -> str:
+
+        if self.reference_message is None:
+            return ""
+
+        # Get miror reference
+        miror_reference_id = self.reference_mirors.get(channel.id)
+
+        # If the miror reference is not accessible,
+        # then use the original reference
+        if miror_reference_id is None:
+            jump_url = self.reference_message.jump_url
+        else:
+            jump_url = channel.get_partial_message(miror_reference_id)\
+                .jump_url
+
+        # Add the croped reference to the miror message
+        reference_preview = WhMirorCodec.encode_reference(
+            self.reference_author,
+            jump_url,
+            self.reference_content
+        )
+
+        WhLog.debug(
+            "miror.reference", "Reference preview rendered",
+            reference=self.reference_message.id,
+            channel=channel.id
+        )
+
+        return reference_preview
+
+    # Compose the miror message -----------------------------------------------
+
+    async def render(
+            self,
+            channel:discord.abc.GuildChannel,
+            links:list[str]=()
+        ) -> str:
+        ref = await self.render_reference_preview(channel)
+        return WhMirorCodec.encode(self.content, self.jump_url, ref, links)
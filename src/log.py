@@ -0,0 +1,114 @@
+#==============================================================================
+# Requirements
+#==============================================================================
+
+# Standard libs ---------------------------------------------------------------
+
+import logging
+
+# Third party libs ------------------------------------------------------------
+
+from LRFutils import logs
+
+#==============================================================================
+# Log
+#==============================================================================
+
+class WhLog:
+    """------------------------------------------------------------------------
+    Leveled and structured logs of the wormhole plugin.
+
+    Messages are %-style templates, formatted only if the event is actually
+    written, so that disabled traces cost a comparison. Each event has a
+    name and may carry fields, written as `key=value` pairs.
+
+    Example
+    -------
+    ```
+    WhLog.debug("relay.send", "Sent to %s", channel.id, latency=0.12)
+    ```
+    ------------------------------------------------------------------------"""
+
+    # Minimum level of the written events (debug traces are off by default)
+    level = logging.INFO
+
+    # Event name -> keep one event out of N (noisy per-message events)
+    sampling:dict[str, int] = {
+        "relay.message": 100,
+        "relay.ignored": 100,
+    }
+
+    # Event name -> number of occurrences, for sampling
+    counters:dict[str, int] = {}
+
+    # Level -> LRFutils writer
+    writers = {
+        logging.DEBUG: logs.info,
+        logging.INFO: logs.info,
+        logging.WARNING: logs.warning,
+        logging.ERROR: logs.error,
+    }
+
+    @staticmethod
+    def enabled(level:int) -> bool:
+        """--------------------------------------------------------------------
+        Return whether the events of a level are written, to skip building
+        costly arguments when they are not
+
+        Parameters
+        ----------
+        - `level` : The level, as a `logging` constant
+        --------------------------------------------------------------------"""
+
+        return level >= WhLog.level
+
+    @staticmethod
+    def log(level:int, event:str, message:str, *args, **fields) -> None:
+        """--------------------------------------------------------------------
+        Write an event if its level is enabled and it is not sampled out
+
+        Parameters
+        ----------
+        - `level` : The level, as a `logging` constant
+        - `event` : The name of the event, like `relay.send`
+        - `message` : The %-style template of the message
+        - `*args` : The arguments of the template
+        - `**fields` : The fields of the event
+        --------------------------------------------------------------------"""
+
+        if level < WhLog.level:
+            return
+
+        every = WhLog.sampling.get(event)
+        if every is not None:
+            count = WhLog.counters.get(event, 0)
+            WhLog.counters[event] = count + 1
+            if count % every:
+                return
+            fields["sampled"] = every
+
+        if args:
+            message = message % args
+        if fields:
+            message += " | " + " ".join(
+                f"{key}={value}" for key, value in fields.items()
+            )
+        WhLog.writers[level](f"Wormhole > [{event}] {message}")
+
+    @staticmethod
+    def debug(event:str, message:str, *args, **fields) -> None:
+        if logging.DEBUG >= WhLog.level:
+            WhLog.log(logging.DEBUG, event, message, *args, **fields)
+
+    @staticmethod
+    def info(event:str, message:str, *args, **fields) -> None:
+        if logging.INFO >= WhLog.level:
+            WhLog.log(logging.INFO, event, message, *args, **fields)
+
+    @staticmethod
+    def warning(event:str, message:str, *args, **fields) -> None:
+        WhLog.log(logging.WARNING, event, message, *args, **fields)
+
+    @staticmethod
+    def error(event:str, message:str, *args, **fields) -> None:
+        WhLog.log(logging.ERROR, event, message, *args, **fields)
@@ -0,0 +1,363 @@
+#==============================================================================
+# Requirements
+#==============================================================================
+
+# Standard libs ---------------------------------------------------------------
+
+import asyncio
+import bisect
+import os
+import time
+from typing import Callable
+
+# Project modules -------------------------------------------------------------
+
+from .log import WhLog
+from .relay import WhSendQueue
+
+#==============================================================================
+# Metrics
+#==============================================================================
+
+class WhCounter:
+
+    kind = "counter"
+
+    def __init__(self, name:str, help:str, labels:tuple[str, ...]=()):
+        """--------------------------------------------------------------------
+        Create a counter, rendered in the Prometheus text format
+
+        Parameters
+        ----------
+        - `name` : The name of the metric
+        - `help` : The description of the metric
+        - `labels` : The names of the labels of the metric
+        --------------------------------------------------------------------"""
+
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+        # Label values -> count
+        self.values:dict[tuple, float] = {}
+
+    def inc(self, *labels, amount:float=1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{WhMetrics.labels(self.labels, labels)} {value}"
+            for labels, value in self.values.items()
+        ]
+
+class WhHistogram:
+
+    kind = "histogram"
+
+    # Default upper bounds of the buckets, in seconds
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(
+            self,
+            name:str,
+            help:str,
+            labels:tuple[str, ...]=(),
+            buckets:tuple[float, ...]=None
+        ):
+        """--------------------------------------------------------------------
+        Create a histogram, rendered in the Prometheus text format
+
+        Parameters
+        ----------
+        - `name` : The name of the metric
+        - `help` : The description of the metric
+        - `labels` : The names of the labels of the metric
+        - `buckets` : The upper bounds of the buckets (default to durations)
+        --------------------------------------------------------------------"""
+
+        self.name = name
+        self.help = help
+        self.labels = labels
+        if buckets is not None:
+            self.buckets = tuple(sorted(buckets))
+
+        # Label values -> [count per bucket (not cumulated), sum, count]
+        self.values:dict[tuple, list] = {}
+
+    def observe(self, value:float, *labels) -> None:
+        data = self.values.get(labels)
+        if data is None:
+            data = self.values[labels] = [[0] * len(self.buckets), 0, 0]
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            data[0][i] += 1
+        data[1] += value
+        data[2] += 1
+
+    def time(self, *labels) -> "WhTimer":
+        """--------------------------------------------------------------------
+        Return a context manager observing the duration of its block
+
+        Example
+        -------
+        ```
+        with WhMetrics.send_seconds.time():
+            await webhook.send(...)
+        ```
+        --------------------------------------------------------------------"""
+
+        return WhTimer(self, labels)
+
+    def render(self) -> list[str]:
+        lines = []
+        for labels, (counts, total, count) in self.values.items():
+            cumulated = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulated += bucket
+                lines.append(
+                    f"{self.name}_bucket"\
+                    + WhMetrics.labels(
+                        self.labels + ("le",),
+                        labels + (bound,)
+                    )\
+                    + f" {cumulated}"
+                )
+            lines.append(
+                f"{self.name}_bucket"\
+                + WhMetrics.labels(self.labels + ("le",), labels + ("+Inf",))\
+                + f" {count}"
+            )
+            suffix = WhMetrics.labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+class WhTimer:
+
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram:WhHistogram, labels:tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "WhTimer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.histogram.observe(
+            time.perf_counter() - self.start,
+            *self.labels
+        )
+
+class WhGauge:
+
+    kind = "gauge"
+
+    def __init__(self, name:str, help:str, collect:Callable[[], float]):
+        """--------------------------------------------------------------------
+        Create a gauge, whose value is collected when the metrics are
+        rendered
+
+        Parameters
+        ----------
+        - `name` : The name of the metric
+        - `help` : The description of the metric
+        - `collect` : The function returning the current value
+        --------------------------------------------------------------------"""
+
+        self.name = name
+        self.help = help
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        return [f"{self.name} {self.collect()}"]
+
+#==============================================================================
+# Registry
+#==============================================================================
+
+class WhMetrics:
+
+    # Address of the scrape endpoint (disabled if the port is None, unless
+    # it is given by the environment variable below)
+    host = "127.0.0.1"
+    port:int = None
+    port_variable = "WORMHOLE_METRICS_PORT"
+
+    server:asyncio.AbstractServer = None
+
+    # Relay -------------------------------------------------------------------
+
+    relayed = WhCounter(
+        "wormhole_messages_relayed_total",
+        "Messages relayed to their linked channels"
+    )
+    relay_seconds = WhHistogram(
+        "wormhole_relay_seconds",
+        "Time to relay a message to all its destinations"
+    )
+    fanout = WhHistogram(
+        "wormhole_fanout_size",
+        "Number of destinations of a relayed message",
+        buckets=(1, 2, 3, 5, 10, 20, 50, 100)
+    )
+    send_seconds = WhHistogram(
+        "wormhole_send_seconds",
+        "Time to send a miror through a webhook"
+    )
+    send_errors = WhCounter(
+        "wormhole_send_errors_total",
+        "Mirors that could not be sent, edited or deleted"
+    )
+    send_queue = WhGauge(
+        "wormhole_send_queue_depth",
+        "Sends waiting in the destination queues",
+        lambda: sum(WhSendQueue.depths().values())
+    )
+
+    # Deletion ----------------------------------------------------------------
+
+    deleted = WhCounter(
+        "wormhole_messages_deleted_total",
+        "Messages whose mirors were deleted"
+    )
+    delete_seconds = WhHistogram(
+        "wormhole_delete_seconds",
+        "Time to delete the mirors of deleted messages"
+    )
+
+    # Lookups -----------------------------------------------------------------
+
+    webhook_cache = WhCounter(
+        "wormhole_webhook_cache_total",
+        "Webhook lookups, by result (hit or miss)",
+        labels=("result",)
+    )
+    miror_lookup_seconds = WhHistogram(
+        "wormhole_miror_lookup_seconds",
+        "Time to look up the mirors of a message in the database",
+        labels=("kind",)
+    )
+
+    # Links -------------------------------------------------------------------
+
+    links_dropped = WhCounter(
+        "wormhole_links_dropped_total",
+        "Links removed because their channel is no longer accessible"
+    )
+
+    # Metrics rendered, in order
+    registry:list = [
+        relayed,
+        relay_seconds,
+        fanout,
+        send_seconds,
+        send_errors,
+        send_queue,
+        deleted,
+        delete_seconds,
+        webhook_cache,
+        miror_lookup_seconds,
+        links_dropped,
+    ]
+
+    @staticmethod
+    def register(metric) -> None:
+        WhMetrics.registry.append(metric)
+
+    @staticmethod
+    def labels(names:tuple[str, ...], values:tuple) -> str:
+        if not names:
+            return ""
+        return "{" + ",".join(
+            f'{name}="{value}"' for name, value in zip(names, values)
+        ) + "}"
+
+    @staticmethod
+    def render() -> str:
+        """--------------------------------------------------------------------
+        Render all the metrics in the Prometheus text exposition format
+
+        Returns
+        -------
+        - The metrics, as text
+        --------------------------------------------------------------------"""
+
+        lines = []
+        for metric in WhMetrics.registry:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    #==========================================================================
+    # Scrape endpoint
+    #==========================================================================
+
+    @staticmethod
+    async def serve() -> None:
+        """--------------------------------------------------------------------
+        Start the local HTTP scrape endpoint, if a port is configured
+        --------------------------------------------------------------------"""
+
+        if WhMetrics.port is None \
+            and os.environ.get(WhMetrics.port_variable, "").isdigit():
+            WhMetrics.port = int(os.environ[WhMetrics.port_variable])
+
+        if WhMetrics.port is None or WhMetrics.server is not None:
+            return
+
+        WhMetrics.server = await asyncio.start_server(
+            WhMetrics._handle,
+            WhMetrics.host,
+            WhMetrics.port
+        )
+        WhLog.info(
+            "metrics.serve", "Metrics served on http://%s:%s/metrics",
+            WhMetrics.host, WhMetrics.port
+        )
+
+    @staticmethod
+    async def close() -> None:
+        """--------------------------------------------------------------------
+        Stop the local HTTP scrape endpoint
+        --------------------------------------------------------------------"""
+
+        server, WhMetrics.server = WhMetrics.server, None
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+
+    @staticmethod
+    async def _handle(
+            reader:asyncio.StreamReader,
+            writer:asyncio.StreamWriter
+        ) -> None:
+
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            parts = request.decode("latin-1").split()
+
+            # Skip the headers of the request
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+
+            if len(parts) >= 2 and parts[0] == "GET" \
+                and parts[1].split("?")[0] in ("/", "/metrics"):
+                status = "200 OK"
+                body = WhMetrics.render().encode()
+            else:
+                status = "404 Not Found"
+                body = b""
+
+            header = f"HTTP/1.1 {status}\r\n"\
+                + "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"\
+                + f"Content-Length: {len(body)}\r\n"\
+                + "Connection: close\r\n\r\n"
+            writer.write(header.encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,213 @@
+#==============================================================================
+# Requirements
+#==============================================================================
+
+# Standard libs ---------------------------------------------------------------
+
+import asyncio
+import collections
+import time
+from typing import Awaitable, Callable, Iterable
+
+# Third party libs ------------------------------------------------------------
+
+import discord
+
+# Project modules -------------------------------------------------------------
+
+from .log import WhLog
+
+#==============================================================================
+# Fan-out
+#==============================================================================
+
+class WhFanOut:
+
+    # Maximum number of destinations processed at the same time
+    max_concurrency = 10
+
+    @staticmethod
+    async def run(
+            channels:Iterable[discord.abc.GuildChannel],
+            action:Callable[[discord.abc.GuildChannel], Awaitable],
+            max_concurrency:int=None
+        ) -> dict[int, BaseException]:
+        """--------------------------------------------------------------------
+        Run an action on several destination channels concurrently.
+        A failing or slow destination doesn't hold up the other ones.
+
+        Parameters
+        ----------
+        - `channels` : The destination channels
+        - `action` : The coroutine function to run for each channel
+        - `max_concurrency` : The maximum number of actions running at the
+        same time (default to `WhFanOut.max_concurrency`)
+
+        Returns
+        -------
+        - The errors raised by the action, indexed by channel ID
+        --------------------------------------------------------------------"""
+
+        channels = list(channels)
+        semaphore = asyncio.Semaphore(
+            max_concurrency or WhFanOut.max_concurrency
+        )
+
+        async def worker(channel):
+            async with semaphore:
+                await action(channel)
+
+        results = await asyncio.gather(
+            *(worker(channel) for channel in channels),
+            return_exceptions=True
+        )
+
+        errors = {}
+        for channel, result in zip(channels, results):
+            if isinstance(result, BaseException):
+                WhLog.error(
+                    "relay.error", "Failed to relay in %s (%s): %r",
+                    channel.name, channel.id, result
+                )
+                errors[channel.id] = result
+
+        return errors
+
+#==============================================================================
+# Send queue
+#==============================================================================
+
+class WhSendQueue:
+
+    # Sends allowed per webhook in a rate limit window (Discord webhook bucket)
+    rate_limit = 5
+
+    # Duration of a rate limit window, in seconds
+    rate_period = 2.0
+
+    # Destination channel ID -> its send queue
+    queues:dict[int, "WhSendQueue"] = {}
+
+    # Shared by all the queues to cap the number of sends in progress
+    semaphore:asyncio.Semaphore = None
+
+    def __init__(self, channel_id:int):
+        self.channel_id = channel_id
+        self.pending = collections.deque()
+        self.sent_at = collections.deque(maxlen=WhSendQueue.rate_limit)
+        self.worker = None
+
+    @staticmethod
+    def submit(
+            channel:discord.abc.GuildChannel,
+            action:Callable[[], Awaitable]
+        ) -> asyncio.Future:
+        """--------------------------------------------------------------------
+        Schedule a send to a destination channel. Sends to a same destination
+        are done one after the other, in submission order, and paced to stay
+        within the webhook rate limit.
+
+        Parameters
+        ----------
+        - `channel` : The destination channel
+        - `action` : The coroutine function doing the send
+
+        Returns
+        -------
+        - A future resolved with the result of the action
+        --------------------------------------------------------------------"""
+
+        if WhSendQueue.semaphore is None:
+            WhSendQueue.semaphore = asyncio.Semaphore(WhFanOut.max_concurrency)
+
+        queue = WhSendQueue.queues.get(channel.id)
+        if queue is None:
+            queue = WhSendQueue.queues[channel.id] = WhSendQueue(channel.id)
+
+        future = asyncio.get_running_loop().create_future()
+        queue.pending.append((action, future))
+        if queue.worker is None or queue.worker.done():
+            queue.worker = asyncio.create_task(queue._work())
+
+        return future
+
+    @staticmethod
+    def depth(channel_id:int) -> int:
+        """--------------------------------------------------------------------
+        Return the number of sends waiting for a destination channel
+
+        Parameters
+        ----------
+        - `channel_id` : The ID of the destination channel
+
+        Returns
+        -------
+        - The number of pending sends
+        --------------------------------------------------------------------"""
+
+        queue = WhSendQueue.queues.get(channel_id)
+        return len(queue.pending) if queue else 0
+
+    @staticmethod
+    def depths() -> dict[int, int]:
+        """--------------------------------------------------------------------
+        Return the number of sends waiting for each destination channel
+
+        Returns
+        -------
+        - The number of pending sends, indexed by channel ID
+        --------------------------------------------------------------------"""
+
+        return {
+            channel_id: len(queue.pending)
+            for channel_id, queue in WhSendQueue.queues.items()
+            if queue.pending
+        }
+
+    async def _pace(self) -> None:
+        """--------------------------------------------------------------------
+        Wait until a new send fits in the current rate limit window
+        --------------------------------------------------------------------"""
+
+        if len(self.sent_at) < WhSendQueue.rate_limit:
+            return
+        delay = WhSendQueue.rate_period - (time.monotonic() - self.sent_at[0])
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _work(self) -> None:
+        """--------------------------------------------------------------------
+        Process the pending sends of the queue, then drop the queue once its
+        rate limit window is over without new submission
+        --------------------------------------------------------------------"""
+
+        while True:
+            while self.pending:
+                action, future = self.pending.popleft()
+                if future.cancelled():
+                    continue
+
+                await self._pace()
+                async with WhSendQueue.semaphore:
+                    try:
+                        result = await action()
+                    except Exception as e:
+                        if not future.cancelled():
+                            future.set_exception(e)
+                    else:
+                        if not future.cancelled():
+                            future.set_result(result)
+                self.sent_at.append(time.monotonic())
+
+            # Keep the queue while its last sends still count in the rate
+            # limit, so that the sends submitted meanwhile are paced
+            if self.sent_at:
+                delay = WhSendQueue.rate_period \
+                    - (time.monotonic() - self.sent_at[-1])
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if not self.pending:
+                break
+
+        if WhSendQueue.queues.get(self.channel_id) is self:
+            del WhSendQueue.queues[self.channel_id]
@@ -1,21 +1,27 @@
-
 import discord
 
 import allay
+from .backend import WhRouter
 
 class WormholeSelector(discord.ui.Select):
-    def __init__(self, wormholes_id:list[int], locale=None):
+
+    # Maximum number of options Discord accepts in a select menu
+    page_size = 25
+
+    def __init__(self, wormholes_id:list[int], locale=None, page:int=0):
         self.wormholes_id = sorted(wormholes_id)
 
         options = []
-        for wh in allay.Database.query(
-                "SELECT * FROM wormholes ORDER BY id ASC"
-            ):
-            if wh['id'] in self.wormholes_id:
+        start = page * WormholeSelector.page_size
+        for wormhole_id in self.wormholes_id[
+                start:start + WormholeSelector.page_size
+            ]:
+            wormhole = WhRouter.wormholes.get(wormhole_id)
+            if wormhole is not None:
                 options.append(
                     discord.SelectOption(
-                        label=wh['name'],
-                        value=str(wh['id'])
+                        label=wormhole.name[:100],
+                        value=str(wormhole.id)
                     )
                 )
 
@@ -26,7 +32,8 @@ class WormholeSelector(discord.ui.Select):
             ),
             min_values=1,
             max_values=1,
-            options=options
+            options=options,
+            row=0
         )
 
     async def callback(self, interaction: discord.Interaction):
@@ -36,12 +43,51 @@ class WormholeSelector(discord.ui.Select):
 class WormholeSelectorView(discord.ui.View):
     def __init__(self, wormholes_id:list[int], locale=None):
         super().__init__()
-        self.add_item(WormholeSelector(wormholes_id, locale=locale))
+        self.wormholes_id = wormholes_id
+        self.locale = locale
+        self.page = 0
+        self.pages = max(
+            1,
+            -(-len(wormholes_id) // WormholeSelector.page_size)
+        )
+        self.selector = WormholeSelector(wormholes_id, locale=locale)
+        self.add_item(self.selector)
+
+        # Only show the page buttons if the options don't fit in one page
+        if self.pages == 1:
+            self.remove_item(self.previous_page)
+            self.remove_item(self.next_page)
+        else:
+            self.update_buttons()
+
+    def update_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page == self.pages - 1
+
+    async def show_page(self, interaction:discord.Interaction, page:int):
+        self.page = page
+        self.remove_item(self.selector)
+        self.selector = WormholeSelector(
+            self.wormholes_id,
+            locale=self.locale,
+            page=page
+        )
+        self.add_item(self.selector)
+        self.update_buttons()
+        await interaction.response.edit_message(view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary, row=1)
+    async def previous_page(self, interaction, button):
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary, row=1)
+    async def next_page(self, interaction, button):
+        await self.show_page(interaction, self.page + 1)
 
     @property
     def interaction(self):
-        return self.children[0].interaction
-    
+        return self.selector.interaction
+
     @property
     def values(self):
-        return self.children[0].values
\ No newline at end of file
+        return self.selector.values